@@ -0,0 +1,3 @@
+from book_recommender.serving.batch_cli import main
+
+main()
@@ -0,0 +1,332 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import traceback
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+import yaml
+import numpy as np
+from benchmarks.synthetic_data import generate_book_crossing
+
+# every stage and query benchmark runs in a fresh spawned process, so the peak RSS
+# of one stage does not include the memory of the stages before it and the
+# book_recommender modules are only imported (and log) inside the benchmark workspace
+STAGE_BENCHMARKS = ["data_validation", "data_transformation", "model_trainer"]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_CONFIG_FILE = os.path.join(REPO_ROOT, "config", "config.yaml")
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process and of its finished worker processes
+    """
+    try:
+        import resource
+    except ImportError:
+        # no getrusage (Windows): current RSS is the best psutil can tell
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if os.path.exists("/proc/self/status"):
+        # linux keeps ru_maxrss of the parent across fork + exec, VmHWM starts over with the new process
+        with open("/proc/self/status") as f:
+            own = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        return max(own, children) / 1024
+    # kilobytes on linux, bytes on macOS
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, children)
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def latency_summary(latencies: list, total_seconds: float, items: int) -> dict:
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "calls": len(latencies),
+        "qps": items / total_seconds if total_seconds else 0.0,
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99))
+    }
+
+
+def time_calls(call, inputs: list, warmup: int = 10, items_per_call: int = 1) -> dict:
+    """
+    Latency of call(item) for every input after a few warmup calls,
+    qps counts items_per_call queries per call (batches)
+    """
+    for item in inputs[:warmup]:
+        call(item)
+    latencies = []
+    start = time.perf_counter()
+    for item in inputs:
+        call_start = time.perf_counter()
+        call(item)
+        latencies.append(time.perf_counter() - call_start)
+    return latency_summary(latencies, time.perf_counter() - start, len(inputs) * items_per_call)
+
+
+def bench_stage(stage: str) -> dict:
+    """
+    Wall time of one training stage on the data of the workspace (the working directory)
+    """
+    from book_recommender.config.configuration import AppConfiguration
+    from book_recommender.components.data_validation import DataValidation
+    from book_recommender.components.data_transformation import DataTransformation
+    from book_recommender.components.model_trainer import ModelTrainer
+
+    app_config = AppConfiguration()
+    if stage == "data_validation":
+        start = time.perf_counter()
+        DataValidation(app_config).initiate_data_validation()
+        return {"wall_time_s": time.perf_counter() - start}
+
+    if stage == "data_transformation":
+        start = time.perf_counter()
+        DataTransformation(app_config).initiate_data_transformation()
+        return {"wall_time_s": time.perf_counter() - start}
+
+    # the trainer steps are timed one by one, the neighbour table usually dominates
+    model_trainer = ModelTrainer(app_config)
+    start = time.perf_counter()
+    book_sparse, model = model_trainer.train()
+    train_done = time.perf_counter()
+    indices, distances = model_trainer.compute_neighbour_table(book_sparse, model)
+    neighbours_done = time.perf_counter()
+    model_trainer.export_serving_bundle(book_sparse, model, indices, distances)
+    end = time.perf_counter()
+    return {
+        "wall_time_s": end - start,
+        "train_s": train_done - start,
+        "neighbours_s": neighbours_done - train_done,
+        "export_s": end - neighbours_done
+    }
+
+
+def bench_queries(n_queries: int, batch_size: int, seed: int) -> dict:
+    """
+    Latency and throughput of the serving calls on the trained artifacts of the workspace.
+    Query titles follow a zipf distribution like real traffic, the result cache is
+    disabled for the *_uncached benchmarks and enabled for recommend_book_cached.
+    """
+    start = time.perf_counter()
+    from book_recommender.config.configuration import AppConfiguration
+    from book_recommender.serving.recommender import BookRecommender
+    from book_recommender.serving.result_cache import ResultCache
+    import_done = time.perf_counter()
+
+    app_config = AppConfiguration()
+    recommender = BookRecommender(app_config)
+    recommender.result_cache = ResultCache(max_entries=0)
+    artifacts = recommender.model_store.get()
+    load_done = time.perf_counter()
+
+    rng = np.random.default_rng(seed)
+    n_titles = len(artifacts.book_names)
+    weights = 1.0 / np.arange(1, n_titles + 1)
+    rows = rng.permutation(n_titles)[rng.choice(n_titles, size=n_queries, p=weights / weights.sum())]
+    titles = [str(artifacts.book_names[row]) for row in rows]
+    batches = [titles[i:i + batch_size] for i in range(0, len(titles), batch_size)]
+    # half a title narrows the catalogue, a swapped pair of letters needs the fuzzy search
+    prefixes = [title[:max(3, len(title) // 2)] for title in titles]
+    typos = [title[:2] + title[3] + title[2] + title[4:] if len(title) > 4 else title for title in titles]
+
+    results = {
+        "startup": {"import_s": import_done - start, "load_s": load_done - import_done, "titles": n_titles},
+        "recommend_book_uncached": time_calls(recommender.recommend_book, titles),
+        f"recommend_books_batch{batch_size}_uncached": time_calls(
+            lambda batch: recommender.recommend_books(batch, 5), batches, warmup=1, items_per_call=batch_size),
+        "search_titles_prefix": time_calls(lambda query: recommender.search_titles(query, 10), prefixes),
+        "search_titles_typo": time_calls(lambda query: recommender.search_titles(query, 10), typos)
+    }
+    recommender.result_cache = ResultCache()
+    results["recommend_book_cached"] = time_calls(recommender.recommend_book, titles)
+    results["recommend_book_cached"]["hit_rate"] = recommender.result_cache.stats()["hit_rate"]
+    return results
+
+
+def _run_child(queue, workspace: str, function, kwargs: dict):
+    try:
+        sys.path.insert(0, REPO_ROOT)
+        os.chdir(workspace)
+        result = function(**kwargs)
+        result["peak_rss_mb"] = peak_rss_mb()
+        queue.put((True, result))
+    except BaseException:
+        queue.put((False, traceback.format_exc()))
+
+
+def run_isolated(workspace: str, function, **kwargs) -> dict:
+    """
+    Runs function(**kwargs) in a fresh spawned process inside the workspace
+    returns its result dict with the peak RSS of the process added
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_child, args=(queue, workspace, function, kwargs))
+    process.start()
+    ok, result = queue.get()
+    process.join()
+    if not ok:
+        raise RuntimeError(f"{function.__name__}{kwargs} failed:\n{result}")
+    return result
+
+
+def parse_override(override: str) -> tuple:
+    """
+    "section.key=value" -> (section, key, value parsed as YAML)
+    """
+    name, sep, value = override.partition("=")
+    section, dot, key = name.partition(".")
+    if not sep or not dot:
+        raise argparse.ArgumentTypeError(f"expected section.key=value, got {override!r}")
+    return section, key, yaml.safe_load(value)
+
+
+def write_workspace_config(workspace: str, overrides: list) -> dict:
+    """
+    config.yaml of the repository with every artifact inside the workspace,
+    serving from the memory mapped bundle the trainer exports
+    """
+    with open(REPO_CONFIG_FILE) as f:
+        config = yaml.safe_load(f)
+    artifacts_dir = os.path.join(workspace, "artifacts")
+    config["artifacts_config"]["artifacts_dir"] = artifacts_dir
+    config["pretrained_config"]["pretrained_dir"] = artifacts_dir
+    config["pretrained_config"]["pretrained_format"] = "mmap"
+    config["pretrained_config"]["pretrained_bundle_dir"] = config["model_trainer_config"]["serving_bundle_dir"]
+    for section, key, value in overrides:
+        config[section][key] = value
+
+    os.makedirs(os.path.join(workspace, "config"), exist_ok=True)
+    with open(os.path.join(workspace, "config", "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return config
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=REPO_ROOT).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(args) -> dict:
+    workspace = args.workspace or tempfile.mkdtemp(prefix="book_recommender_bench_")
+    try:
+        config = write_workspace_config(workspace, args.overrides)
+        books_dir = os.path.join(config["artifacts_config"]["artifacts_dir"], config["data_ingestion_config"]["dataset_dir"],
+                                 config["data_ingestion_config"]["ingested_data_dir"], "books_data")
+        start = time.perf_counter()
+        data = generate_book_crossing(books_dir, args.users, args.titles, args.ratings, args.seed)
+        print(f"Generated {data} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+        results = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "git_commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "scale": {"users": args.users, "titles": args.titles, "ratings": args.ratings, "seed": args.seed},
+                "data": data,
+                "overrides": [f"{section}.{key}={value}" for section, key, value in args.overrides]
+            },
+            "stages": {},
+            "queries": {}
+        }
+        for stage in STAGE_BENCHMARKS:
+            results["stages"][stage] = run_isolated(workspace, bench_stage, stage=stage)
+            print(f"{stage}: {results['stages'][stage]['wall_time_s']:.2f}s", file=sys.stderr)
+        if not args.skip_queries:
+            results["queries"] = run_isolated(workspace, bench_queries, n_queries=args.queries,
+                                              batch_size=args.batch_size, seed=args.seed)
+            results["queries"]["startup"]["peak_rss_mb"] = results["queries"].pop("peak_rss_mb")
+        return results
+
+    finally:
+        if not args.workspace and not args.keep_workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+
+def metric_direction(metric: str):
+    """
+    1: lower is better (times, memory), -1: higher is better (throughput), None: not compared
+    """
+    if metric == "qps":
+        return -1
+    if metric.endswith(("_s", "_ms", "_mb")):
+        return 1
+    return None
+
+
+def compare_with_baseline(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Every metric that got worse than the baseline by more than threshold (0.2 = 20 %)
+    returns a list of (benchmark, metric, baseline value, current value, relative change)
+    """
+    regressions = []
+    for section in ["stages", "queries"]:
+        for name, metrics in results.get(section, {}).items():
+            baseline_metrics = baseline.get(section, {}).get(name, {})
+            for metric, value in metrics.items():
+                direction = metric_direction(metric)
+                old = baseline_metrics.get(metric)
+                if direction is None or not old:
+                    continue
+                change = (value - old) / old
+                if change * direction > threshold:
+                    regressions.append((f"{section}.{name}", metric, old, value, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the training stages and serving queries on synthetic Book-Crossing data")
+    parser.add_argument("--users", type=int, default=20000, help="users of the synthetic data")
+    parser.add_argument("--titles", type=int, default=20000, help="titles of the synthetic data")
+    parser.add_argument("--ratings", type=int, default=1_000_000, help="ratings of the synthetic data")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the data and of the query sample")
+    parser.add_argument("--queries", type=int, default=2000, help="serving calls per query benchmark")
+    parser.add_argument("--batch-size", type=int, default=64, help="titles per recommend_books call")
+    parser.add_argument("--set", dest="overrides", type=parse_override, action="append", default=[],
+                        metavar="SECTION.KEY=VALUE", help="config.yaml override, e.g. data_transformation_config.transformation_mode=sparse")
+    parser.add_argument("--skip-queries", action="store_true", help="only benchmark the training stages")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--baseline", help="JSON results to compare against, exits with 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown reported as a regression")
+    parser.add_argument("--save-baseline", help="also store the results as the baseline at this path")
+    parser.add_argument("--workspace", help="directory for the data and artifacts (kept), default: a temporary directory")
+    parser.add_argument("--keep-workspace", action="store_true", help="keep the temporary workspace")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args)
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {path}", file=sys.stderr)
+
+    for section in ["stages", "queries"]:
+        for name, metrics in results[section].items():
+            print(f"{section}.{name}: " + ", ".join(f"{metric}={value:.4g}" for metric, value in metrics.items()))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("scale") != results["meta"]["scale"]:
+            print(f"Warning: baseline scale {baseline.get('meta', {}).get('scale')} differs from {results['meta']['scale']}", file=sys.stderr)
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        for benchmark, metric, old, new, change in regressions:
+            print(f"REGRESSION {benchmark}.{metric}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression above {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
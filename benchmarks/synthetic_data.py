@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pandas as pd
+
+def generate_book_crossing(output_dir: str, n_users: int = 20000, n_titles: int = 20000,
+                           n_ratings: int = 1_000_000, seed: int = 42) -> dict:
+    """
+    Writes books.csv and ratings.csv in the Book-Crossing format (";" separated, latin-1)
+    so the pipeline can be benchmarked offline at any scale. Shaped like the real dump:
+    - heavy tailed ratings per user and zipf distributed book popularity
+    - about 60 % implicit (0) ratings, explicit ones between 1 and 10
+    - some titles with several ISBNs (editions) and ratings of ISBNs missing from books.csv
+    returns the number of users, books and ratings written
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # editions: about 10 % more ISBNs than titles, sharing titles
+    n_books = int(n_titles * 1.1)
+    isbns = np.array([f"{i:09d}{'X' if i % 10 == 0 else i % 10}" for i in range(n_books)])
+    title_ids = np.concatenate([np.arange(n_titles), rng.integers(0, n_titles, n_books - n_titles)])
+    books = pd.DataFrame({
+        "ISBN": isbns,
+        "Book-Title": [f"Synthetic Book {title_id} Volume {title_id % 7}" for title_id in title_ids],
+        "Book-Author": [f"Author {title_id % 997}" for title_id in title_ids],
+        "Year-Of-Publication": 1950 + title_ids % 55,
+        "Publisher": [f"Publisher {title_id % 211}" for title_id in title_ids],
+        "Image-URL-S": [f"http://images.example.com/{isbn}.01.THUMBZZZ.jpg" for isbn in isbns],
+        "Image-URL-M": [f"http://images.example.com/{isbn}.01.MZZZZZZZ.jpg" for isbn in isbns],
+        "Image-URL-L": [f"http://images.example.com/{isbn}.01.LZZZZZZZ.jpg" for isbn in isbns]
+    })
+
+    # 5 % of the rated ISBNs are unknown to books.csv
+    n_unknown = max(1, n_books // 20)
+    book_weights = 1.0 / np.arange(1, n_books + n_unknown + 1) ** 0.9
+    rng.shuffle(book_weights)
+    user_weights = rng.lognormal(mean=0.0, sigma=1.5, size=n_users)
+
+    rated_books = rng.choice(n_books + n_unknown, size=n_ratings, p=book_weights / book_weights.sum())
+    users = 1 + rng.choice(n_users, size=n_ratings, p=user_weights / user_weights.sum())
+    ratings = np.where(rng.random(n_ratings) < 0.6, 0, rng.integers(1, 11, n_ratings))
+    rated_isbns = np.where(rated_books < n_books, isbns[np.minimum(rated_books, n_books - 1)],
+                           np.char.add("U", rated_books.astype(str)))
+
+    ratings = pd.DataFrame({"User-ID": users, "ISBN": rated_isbns, "Book-Rating": ratings})
+    ratings = ratings.drop_duplicates(["User-ID", "ISBN"])
+
+    books.to_csv(os.path.join(output_dir, "books.csv"), sep=";", index=False, encoding="latin-1")
+    ratings.to_csv(os.path.join(output_dir, "ratings.csv"), sep=";", index=False, encoding="latin-1")
+    return {"users": int(ratings["User-ID"].nunique()), "books": len(books), "ratings": len(ratings)}
@@ -5,33 +5,50 @@ import sys
 from book_recommender.logging.log import logger
 from book_recommender.exception.exception_handler import AppException
 from book_recommender.config.configuration import AppConfiguration
-import urllib.request
+from book_recommender.utils.instrumentation import instrument, record_counts
+from book_recommender.utils.util import file_sha256
+from book_recommender.utils.download import download_file, file_crc32
 import zipfile
 
 class DataIngestion:
-    def __init__(self, app_config=AppConfiguration()):
+    def __init__(self, app_config = None):
         """
         DataIngestion Initialization
         data_ingestion_config : DataIngestionConfig
         """
         try:
+            app_config = app_config or AppConfiguration()
             self.data_ingestion_config = app_config.get_data_ingestion_config()
         except Exception as e:
             logger.error(e)
             raise AppException(e, sys) from e
         
+    @instrument("data_ingestion.download_data")
     def download_data(self):
         """
-        Fetch the data from the url
+        Fetch the data from the url, streamed in chunks and resumed after interruptions
+        An existing zip is kept while it matches dataset_sha256 (or no checksum is configured)
         """
         try:
-            dataset_url = self.data_ingestion_config.dataset_download_url
-            zip_download_dir = self.data_ingestion_config.raw_data_dir
+            config = self.data_ingestion_config
+            dataset_url = config.dataset_download_url
+            zip_download_dir = config.raw_data_dir
             os.makedirs(zip_download_dir, exist_ok=True)
             data_filename = os.path.basename(dataset_url)
             zip_file_path = os.path.join(zip_download_dir, data_filename)
+            if os.path.exists(zip_file_path) and os.path.getsize(zip_file_path) > 0:
+                if not config.dataset_sha256 or file_sha256(zip_file_path) == config.dataset_sha256.lower():
+                    logger.info(f"Dataset already downloaded at {zip_file_path}, skipping download")
+                    return zip_file_path
+                logger.warning(f"{zip_file_path} does not match dataset_sha256, downloading it again")
+                os.remove(zip_file_path)
             logger.info(f"Downloading dataset from {dataset_url} into file {zip_file_path}")
-            urllib.request.urlretrieve(dataset_url, zip_file_path)
+            download_file(dataset_url, zip_file_path,
+                          chunk_size=config.download_chunk_size,
+                          max_retries=config.download_max_retries,
+                          timeout=config.download_timeout_seconds,
+                          expected_sha256=config.dataset_sha256)
+            record_counts(zip_bytes=os.path.getsize(zip_file_path))
             logger.info(f"Downloaded dataset from {dataset_url} into {zip_file_path}")
             return zip_file_path
         
@@ -39,22 +56,60 @@ class DataIngestion:
             logger.error(e)
             raise AppException(e, sys) from e
         
+    def get_member_path(self, ingested_dir: str, member_name: str) -> str:
+        """
+        Path of a zip member inside ingested_dir, cleaned like ZipFile.extractall:
+        absolute, drive, "." and ".." components are dropped so no member is written outside ingested_dir
+        """
+        parts = [part for part in os.path.splitdrive(member_name.replace("\\", "/"))[1].split("/")
+                 if part not in ("", ".", "..")]
+        target_path = os.path.join(ingested_dir, *parts)
+        root = os.path.realpath(ingested_dir)
+        if not parts or os.path.commonpath([root, os.path.realpath(target_path)]) != root:
+            raise ValueError(f"Zip member {member_name} would be extracted outside of {ingested_dir}")
+        return target_path
+
+    @instrument("data_ingestion.extract_zip_file")
     def extract_zip_file(self, zip_file_path: str):
         """
         zip_file_path: str
-        Extracts the zip file into raw data directory
+        Extracts the members named in extract_members (matched by file name, their
+        folders inside the zip are kept) into the ingested data directory.
+        Files that already match the size and CRC-32 recorded in the zip are not extracted again
         Function returns None
         """
         try:
             ingested_dir = self.data_ingestion_config.ingested_dir
+            extract_members = self.data_ingestion_config.extract_members
             os.makedirs(ingested_dir, exist_ok=True)
             with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
-                zip_ref.extractall(ingested_dir)
-            logger.info(f"extracting zip file: {zip_file_path} into dir: {ingested_dir}")
+                members = [info for info in zip_ref.infolist()
+                           if not info.is_dir() and os.path.basename(info.filename) in extract_members]
+                missing = set(extract_members) - {os.path.basename(info.filename) for info in members}
+                if missing:
+                    raise FileNotFoundError(f"{sorted(missing)} not found in {zip_file_path}")
+
+                extracted = 0
+                for info in members:
+                    target_path = self.get_member_path(ingested_dir, info.filename)
+                    if os.path.exists(target_path) and os.path.getsize(target_path) == info.file_size \
+                            and file_crc32(target_path) == info.CRC:
+                        logger.info(f"{target_path} matches {info.filename} in the zip, skipping extraction")
+                        continue
+                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                    tmp_path = os.path.join(os.path.dirname(target_path), f".{os.path.basename(target_path)}.tmp")
+                    with zip_ref.open(info) as source, open(tmp_path, "wb") as target:
+                        for block in iter(lambda: source.read(1 << 20), b""):
+                            target.write(block)
+                    os.replace(tmp_path, target_path)
+                    extracted += 1
+                    logger.info(f"extracting {info.filename} from zip file: {zip_file_path} into dir: {ingested_dir}")
+            record_counts(members=len(members), extracted=extracted)
         except Exception as e:
             logger.error(e)
             raise AppException(e, sys) from e
         
+    @instrument("data_ingestion")
     def initiate_data_ingestion(self):
         try:
             logger.info(f"{"="*20} Data Ingestion Started {"="*20}")
@@ -3,27 +3,80 @@
 import os
 import sys
 import pickle
+import numpy as np
 import pandas as pd
+from scipy.sparse import coo_matrix, save_npz
 from book_recommender.config.configuration import AppConfiguration
 from book_recommender.logging.log import logger
 from book_recommender.exception.exception_handler import AppException
+from book_recommender.utils.clean_data import read_clean_data
+from book_recommender.utils.title_search import build_title_search_arrays
+from book_recommender.utils.dtype_policy import cast_ratings, save_dtype_report
+from book_recommender.utils.instrumentation import instrument, record_counts
 
 class DataTransformation:
-    def __init__(self, app_config = AppConfiguration()):
+    def __init__(self, app_config = None):
         try:
+            app_config = app_config or AppConfiguration()
             self.data_transformation_config = app_config.get_data_transformation_config()
             self.data_validation_config = app_config.get_data_validation_config()
+            self.dtype_config = app_config.get_dtype_config()
         except Exception as e:
             logger.error(e)
             raise AppException(e, sys) from e
         
+    @instrument("data_transformation.get_data_transformer")
     def get_data_transformer(self):
         """
         Transforms the final data into pivot table for collaborative filtering
         """
         try:
-            df = pd.read_csv(os.path.join(self.data_validation_config.clean_data_dir, "clean_data.csv"))
+            # only the columns of the pivot, posters are read separately below
+            df = read_clean_data(self.data_transformation_config.clean_data_dir, columns=["title", "user_id", "rating"])
             
+            if self.data_transformation_config.transformation_mode == "sparse":
+                book_names = self.save_sparse_pivot(df)
+            else:
+                book_names = self.save_dense_pivot(df)
+            logger.info(f"book_names data shape : {book_names.shape}")
+            record_counts(clean_rows=len(df), titles=len(book_names))
+
+            # saving book names for web app
+            os.makedirs(self.data_validation_config.serialized_objects_dir, exist_ok=True)
+            pickle.dump(book_names, open(os.path.join(self.data_validation_config.serialized_objects_dir, "book_names.pkl"), "wb"))
+            logger.info(f"Saved book_names.pkl to: {self.data_validation_config.serialized_objects_dir}")
+
+            # title search index ranked by the number of ratings of each title
+            popularity = df["title"].value_counts().reindex(book_names, fill_value=0).to_numpy()
+            self.save_title_search_index(book_names, popularity)
+
+            # save title lookup indexes so the web app never scans final_ratings
+            del df
+            posters = read_clean_data(self.data_transformation_config.clean_data_dir, columns=["title", "image_url"])
+            title_index, poster_index = self.get_lookup_indexes(posters, book_names)
+            pickle.dump(title_index, open(os.path.join(self.data_validation_config.serialized_objects_dir, "title_index.pkl"), "wb"))
+            pickle.dump(poster_index, open(os.path.join(self.data_validation_config.serialized_objects_dir, "poster_index.pkl"), "wb"))
+            logger.info(f"Saved title_index.pkl and poster_index.pkl to: {self.data_validation_config.serialized_objects_dir}")
+
+            # row aligned title and poster arrays for the pickle free serving bundle
+            np.save(os.path.join(self.data_transformation_config.transformed_data_dir, "book_titles.npy"), np.asarray(book_names, dtype=str))
+            np.save(os.path.join(self.data_transformation_config.transformed_data_dir, "book_posters.npy"),
+                    np.asarray([poster_index.get(title, "") for title in book_names], dtype=str))
+            logger.info(f"Saved book_titles.npy and book_posters.npy to : {self.data_transformation_config.transformed_data_dir}")
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def save_dense_pivot(self, df):
+        """
+        Builds the dense titles x users pivot table and pickles it
+        returns the book names (pivot index)
+        """
+        try:
+            # plain strings, a categorical index would keep unused titles as rows
+            df = df.astype({"title": object})
+
             # create a pivot table
             book_pivot = df.pivot_table(
                 index="title",
@@ -31,31 +84,124 @@ class DataTransformation:
                 values="rating"
             )
             logger.info(f"book_pivot data shape : {book_pivot.shape}")
-            book_pivot.fillna(0, inplace=True)
-
-            # save book names
-            book_names = book_pivot.index
-            logger.info(f"book_names data shape : {book_names.shape}")
+            record_counts(pivot_shape=book_pivot.shape)
+            book_pivot = pd.DataFrame(cast_ratings(book_pivot.fillna(0).to_numpy(), self.dtype_config.rating_dtype),
+                                      index=book_pivot.index, columns=book_pivot.columns)
+            book_users = np.asarray(book_pivot.columns, dtype=self.dtype_config.index_dtype)
 
             # save book_pivot table data
             os.makedirs(self.data_transformation_config.transformed_data_dir, exist_ok=True)
             pickle.dump(book_pivot, open(os.path.join(self.data_transformation_config.transformed_data_dir, "book_pivot.pkl"), "wb"))
-            logger.info(f"Saved book_pivot.pkl to : {self.data_transformation_config.transformed_data_dir}")
-
-            # saving book names for web app
-            os.makedirs(self.data_validation_config.serialized_objects_dir, exist_ok=True)
-            pickle.dump(book_names, open(os.path.join(self.data_validation_config.serialized_objects_dir, "book_names.pkl"), "wb"))
-            logger.info(f"Saved book_names.pkl to: {self.data_validation_config.serialized_objects_dir}")
+            np.save(os.path.join(self.data_transformation_config.transformed_data_dir, "book_users.npy"), book_users)
+            logger.info(f"Saved book_pivot.pkl and book_users.npy to : {self.data_transformation_config.transformed_data_dir}")
+            save_dtype_report(os.path.join(self.data_transformation_config.transformed_data_dir, "dtype_report.json"),
+                              {"book_pivot.pkl": book_pivot, "book_users.npy": book_users}, self.dtype_config)
 
             # save book_pivot data for web app
             os.makedirs(self.data_validation_config.serialized_objects_dir, exist_ok=True)
             pickle.dump(book_pivot, open(os.path.join(self.data_validation_config.serialized_objects_dir, "book_pivot.pkl"), "wb"))
             logger.info(f"Saved book_pivot.pkl for web app to: {self.data_validation_config.serialized_objects_dir}")
 
+            return book_pivot.index
+
         except Exception as e:
             logger.error(e)
             raise AppException(e, sys) from e
-        
+
+    def build_sparse_pivot(self, df):
+        """
+        Builds the titles x users csr matrix straight from categorical codes,
+        memory scales with the number of ratings instead of titles x users.
+        Rows and columns come out in the same sorted order as pivot_table,
+        the cleaned data already has one rating per (user_id, title) pair
+        returns (book_sparse, titles, user_ids)
+        """
+        try:
+            df = df.dropna(subset=["title", "user_id", "rating"])
+            # categorical columns of the parquet clean data keep unused and unsorted categories
+            titles = pd.Categorical(df["title"]).remove_unused_categories()
+            titles = titles.reorder_categories(titles.categories.sort_values())
+            users = pd.Categorical(df["user_id"])
+
+            book_sparse = coo_matrix(
+                (cast_ratings(df["rating"].to_numpy(), self.dtype_config.rating_dtype), (titles.codes, users.codes)),
+                shape=(len(titles.categories), len(users.categories))
+            ).tocsr()
+            # explicit zero ratings are absent in the dense pivot's csr form as well
+            book_sparse.eliminate_zeros()
+
+            return book_sparse, pd.Index(titles.categories, name="title"), pd.Index(users.categories, name="user_id")
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def save_sparse_pivot(self, df):
+        """
+        Builds the sparse pivot and saves it as book_pivot.npz together with
+        the user (book_users.npy) vocabulary, the title vocabulary (book_titles.npy)
+        is written next to it by get_data_transformer
+        returns the book names
+        """
+        try:
+            book_sparse, book_names, user_ids = self.build_sparse_pivot(df)
+            logger.info(f"book_pivot sparse shape : {book_sparse.shape}, non zero ratings : {book_sparse.nnz}")
+            record_counts(pivot_shape=book_sparse.shape, pivot_nnz=book_sparse.nnz)
+            book_users = np.asarray(user_ids, dtype=self.dtype_config.index_dtype)
+
+            for output_dir in (self.data_transformation_config.transformed_data_dir, self.data_validation_config.serialized_objects_dir):
+                os.makedirs(output_dir, exist_ok=True)
+                save_npz(os.path.join(output_dir, "book_pivot.npz"), book_sparse)
+                np.save(os.path.join(output_dir, "book_users.npy"), book_users)
+                logger.info(f"Saved book_pivot.npz and book_users.npy to : {output_dir}")
+            np.save(os.path.join(self.data_validation_config.serialized_objects_dir, "book_titles.npy"), np.asarray(book_names, dtype=str))
+            save_dtype_report(os.path.join(self.data_transformation_config.transformed_data_dir, "dtype_report.json"),
+                              {"book_pivot.npz": book_sparse, "book_users.npy": book_users}, self.dtype_config)
+
+            return book_names
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("data_transformation.save_title_search_index")
+    def save_title_search_index(self, book_names, popularity):
+        """
+        Saves the title search arrays as title_search.npz for the web app and the serving bundle
+        """
+        try:
+            search_arrays = build_title_search_arrays(book_names, popularity)
+            for output_dir in (self.data_transformation_config.transformed_data_dir, self.data_validation_config.serialized_objects_dir):
+                os.makedirs(output_dir, exist_ok=True)
+                np.savez(os.path.join(output_dir, "title_search.npz"), **search_arrays)
+                logger.info(f"Saved title_search.npz to : {output_dir}")
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def get_lookup_indexes(self, df, book_names):
+        """
+        Builds title -> pivot row id and title -> image_url hash indexes
+        df : cleaned ratings dataframe with title and image_url columns
+        book_names : pivot table index
+        """
+        try:
+            title_index = {title: row for row, title in enumerate(book_names)}
+
+            # first image_url seen for a title, same as the old np.where(...)[0][0] lookup
+            posters = df.drop_duplicates("title")
+            posters = posters[posters["title"].isin(title_index)]
+            poster_index = dict(zip(posters["title"], posters["image_url"]))
+            logger.info(f"title_index size : {len(title_index)}, poster_index size : {len(poster_index)}")
+
+            return title_index, poster_index
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("data_transformation")
     def initiate_data_transformation(self):
         try:
             logger.info(f"{"="*20} Data Transformation Started {"="*20}")
@@ -3,32 +3,71 @@
 import os
 import sys
 import pickle
+import numpy as np
 import pandas as pd
 from book_recommender.logging.log import logger
 from book_recommender.config.configuration import AppConfiguration
 from book_recommender.exception.exception_handler import AppException
+from book_recommender.utils.clean_data import CleanDataWriter, compact_dtypes
+from book_recommender.utils.dtype_policy import save_dtype_report
+from book_recommender.utils.instrumentation import instrument, record_counts
 
 class DataValidation:
-    def __init__(self, app_config = AppConfiguration()):
+    def __init__(self, app_config = None):
         try:
+            app_config = app_config or AppConfiguration()
             self.data_validation_config = app_config.get_data_validation_config()
+            self.dtype_config = app_config.get_dtype_config()
         except Exception as e:
             logger.error(e)
             raise AppException(e, sys) from e
         
-    def preprocess_data(self):
+    def read_ratings(self, ratings_csv_file: str):
         """
-        Preprocess the csv files to get the desired modifications
+        Reads a Book-Crossing ratings csv (User-ID;ISBN;Book-Rating) with renamed columns,
+        ISBN is read as a string so a file of numeric looking ISBNs (e.g. a small delta) keeps its leading zeros
         """
         try:
-            ratings = pd.read_csv(self.data_validation_config.ratings_csv_file, sep=";", on_bad_lines="skip", encoding="latin-1")
-            books = pd.read_csv(self.data_validation_config.books_csv_file, sep=";", on_bad_lines="skip", encoding="latin-1", low_memory=False)
+            ratings = pd.read_csv(ratings_csv_file, sep=";", on_bad_lines="skip", encoding="latin-1", dtype={"ISBN": str})
+            ratings.rename(columns={
+                "User-ID" : "user_id",
+                "ISBN" : "isbn",
+                "Book-Rating" : "rating"
+            }, inplace=True)
+            return ratings
 
-            logger.info(f"shape of ratings csv file: {ratings.shape}")
-            logger.info(f"shape of books csv file: {books.shape}")
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def read_ratings_chunks(self, chunk_size: int):
+        """
+        Yields ratings.csv in chunks of chunk_size rows with renamed columns,
+        ISBN is read as a string so a chunk of numeric looking ISBNs keeps its leading zeros
+        """
+        try:
+            chunks = pd.read_csv(self.data_validation_config.ratings_csv_file, sep=";", on_bad_lines="skip",
+                                 encoding="latin-1", dtype={"ISBN": str}, chunksize=chunk_size)
+            for chunk in chunks:
+                yield chunk.rename(columns={
+                    "User-ID" : "user_id",
+                    "ISBN" : "isbn",
+                    "Book-Rating" : "rating"
+                })
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def read_books(self):
+        """
+        Reads books.csv, keeps the large image url for posters and renames the columns
+        """
+        try:
+            books = pd.read_csv(self.data_validation_config.books_csv_file, sep=";", on_bad_lines="skip", encoding="latin-1", low_memory=False)
 
             # here image url column is important for the poster so we will keep it
-            books.drop(columns=["Image-URL-S", "Image-URL-M"], axis=1, inplace=True)
+            books.drop(columns=["Image-URL-S", "Image-URL-M"], inplace=True)
 
             # renaming for efficient preprocessing
             books.rename(columns={
@@ -39,49 +78,202 @@ class DataValidation:
                 "Publisher" : "publisher",
                 "Image-URL-L" : "image_url"
             }, inplace=True)
+            return books
 
-            ratings.rename(columns={
-                "User-ID" : "user_id",
-                "ISBN" : "isbn",
-                "Book-Rating" : "rating"
-            }, inplace=True)
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
 
-            # store users who have rated atleast 200 books
-            x = ratings["user_id"].value_counts() >= 200
-            y = x[x].index
-            ratings = ratings[ratings["user_id"].isin(y)]
+    def get_clean_data_path(self) -> str:
+        return os.path.join(self.data_validation_config.clean_data_dir,
+                            f"clean_data.{self.data_validation_config.clean_data_format}")
 
-            # joining ratings with books
-            ratings_with_books = ratings.merge(books, on="isbn")
+    def filter_popular_books(self, ratings_with_books):
+        """
+        Keeps books with at least min_book_ratings ratings and one rating per (user_id, title)
+        ratings_with_books : ratings of the active users joined with books
+        """
+        try:
             total_ratings = ratings_with_books.groupby("title")["rating"].count().reset_index()
             total_ratings = total_ratings.rename(columns={"rating" : "total_ratings"})
             books_with_ratings = ratings_with_books.merge(total_ratings, on="title")
 
             # books which have minimum 50 or more ratings
-            final_ratings = books_with_ratings[books_with_ratings["total_ratings"] >= 50]
+            final_ratings = books_with_ratings[books_with_ratings["total_ratings"] >= self.data_validation_config.min_book_ratings]
 
             # drop duplicate rows
-            final_ratings = final_ratings.drop_duplicates(["user_id", "title"])
+            return final_ratings.drop_duplicates(["user_id", "title"])
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def save_incremental_state(self, user_counts, ratings_with_books):
+        """
+        Persists what incremental retraining needs to update the thresholds later:
+        rating counts of every user and the ratings of active users joined with books
+        ratings_with_books : dataframe, or path of a csv with it (streaming mode)
+        """
+        try:
+            state_dir = self.data_validation_config.incremental_state_dir
+            os.makedirs(state_dir, exist_ok=True)
+            np.savez(os.path.join(state_dir, "user_counts.npz"),
+                     user_ids=user_counts.index.to_numpy(dtype=np.int64),
+                     counts=user_counts.to_numpy(dtype=np.int64))
+
+            # only one of active_ratings.pkl / active_ratings.csv may exist
+            if isinstance(ratings_with_books, str):
+                os.replace(ratings_with_books, os.path.join(state_dir, "active_ratings.csv"))
+                stale_path = os.path.join(state_dir, "active_ratings.pkl")
+            else:
+                pickle.dump(ratings_with_books, open(os.path.join(state_dir, "active_ratings.pkl"), "wb"))
+                stale_path = os.path.join(state_dir, "active_ratings.csv")
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+
+            pending_ratings = pd.DataFrame({"user_id": pd.Series(dtype=np.int64),
+                                            "isbn": pd.Series(dtype=object),
+                                            "rating": pd.Series(dtype=np.int64)})
+            pickle.dump(pending_ratings, open(os.path.join(state_dir, "pending_ratings.pkl"), "wb"))
+            logger.info(f"Saved incremental training state to : {state_dir}")
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("data_validation.preprocess_data")
+    def preprocess_data(self):
+        """
+        Preprocess the csv files to get the desired modifications
+        """
+        try:
+            ratings = self.read_ratings(self.data_validation_config.ratings_csv_file)
+            books = self.read_books()
+
+            logger.info(f"shape of ratings csv file: {ratings.shape}")
+            logger.info(f"shape of books csv file: {books.shape}")
+            record_counts(ratings_rows=len(ratings), books_rows=len(books))
+
+            # store users who have rated atleast 200 books
+            user_counts = ratings["user_id"].value_counts()
+            x = user_counts >= self.data_validation_config.min_user_ratings
+            y = x[x].index
+            ratings = ratings[ratings["user_id"].isin(y)]
+
+            # joining ratings with books
+            ratings_with_books = ratings.merge(books, on="isbn")
+            final_ratings = compact_dtypes(self.filter_popular_books(ratings_with_books), self.dtype_config)
             logger.info(f"Shape of final cleaned dataset: {final_ratings.shape}")
+            record_counts(clean_rows=len(final_ratings), active_users=len(y))
 
             # saving the cleaned data for transformations
             os.makedirs(self.data_validation_config.clean_data_dir, exist_ok=True)
-            final_ratings.to_csv(os.path.join(self.data_validation_config.clean_data_dir, "clean_data.csv"), index=False)
-            logger.info(f"Saved clean_data.csv into : {self.data_validation_config.clean_data_dir}")
+            with CleanDataWriter(self.get_clean_data_path(), self.dtype_config) as writer:
+                writer.write(final_ratings)
+            logger.info(f"Saved {os.path.basename(self.get_clean_data_path())} into : {self.data_validation_config.clean_data_dir}")
 
             # saving final_ratings object for web app
             os.makedirs(self.data_validation_config.serialized_objects_dir, exist_ok=True)
             pickle.dump(final_ratings, open(os.path.join(self.data_validation_config.serialized_objects_dir, "final_ratings.pkl"), "wb"))
             logger.info(f"Saved final_ratings.pkl file to {self.data_validation_config.serialized_objects_dir}")
+            save_dtype_report(os.path.join(self.data_validation_config.clean_data_dir, "dtype_report.json"),
+                              {"final_ratings.pkl": final_ratings}, self.dtype_config)
+
+            self.save_incremental_state(user_counts, ratings_with_books)
 
         except Exception as e:
             logger.error(e)
             raise AppException(e, sys) from e
         
+    def get_chunk_size(self, books) -> int:
+        """
+        Rows per ratings chunk so that a chunk, its filtered copy and its join
+        with books fit into memory_budget_mb next to the books table
+        """
+        try:
+            budget = self.data_validation_config.memory_budget_mb * 1024 ** 2
+            sample = pd.read_csv(self.data_validation_config.ratings_csv_file, sep=";", on_bad_lines="skip",
+                                 encoding="latin-1", dtype={"ISBN": str}, nrows=10_000)
+            books_bytes = books.memory_usage(deep=True).sum()
+            row_bytes = (sample.memory_usage(deep=True).sum() / max(len(sample), 1) +
+                         books_bytes / max(len(books), 1))
+            available = max(budget - books_bytes, budget // 4)
+            return max(1_000, int(available // (3 * row_bytes)))
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("data_validation.stream_preprocess_data")
+    def stream_preprocess_data(self):
+        """
+        Bounded memory version of preprocess_data writing the same clean data:
+        1. counting pass over ratings.csv for the active users
+        2. filtered pass joining the ratings of active users with books into a spool csv,
+           counting the ratings per title on the way
+        3. pass over the spool keeping popular books and one rating per (user_id, title)
+        Only the title counts and the (user_id, title) pairs already written stay in memory.
+        """
+        try:
+            books = self.read_books()
+            chunk_size = self.get_chunk_size(books)
+            logger.info(f"Streaming ratings csv in chunks of {chunk_size} rows "
+                        f"(memory budget {self.data_validation_config.memory_budget_mb} MB)")
+
+            user_counts = pd.Series(dtype=np.int64)
+            for chunk in self.read_ratings_chunks(chunk_size):
+                user_counts = user_counts.add(chunk["user_id"].value_counts(), fill_value=0)
+            user_counts = user_counts.astype(np.int64)
+            active_users = user_counts.index[user_counts >= self.data_validation_config.min_user_ratings]
+            logger.info(f"{len(active_users)} of {len(user_counts)} users have at least "
+                        f"{self.data_validation_config.min_user_ratings} ratings")
+
+            clean_data_dir = self.data_validation_config.clean_data_dir
+            os.makedirs(clean_data_dir, exist_ok=True)
+            # dtype_report.json describes final_ratings.pkl of the in-memory path
+            if os.path.exists(os.path.join(clean_data_dir, "dtype_report.json")):
+                os.remove(os.path.join(clean_data_dir, "dtype_report.json"))
+            spool_path = os.path.join(clean_data_dir, ".ratings_with_books.csv")
+            title_counts = pd.Series(dtype=np.int64)
+            with open(spool_path, "w", newline="", encoding="utf-8") as spool:
+                for i, chunk in enumerate(self.read_ratings_chunks(chunk_size)):
+                    ratings_with_books = chunk[chunk["user_id"].isin(active_users)].merge(books, on="isbn")
+                    rated = ratings_with_books.loc[ratings_with_books["rating"].notna(), "title"]
+                    title_counts = title_counts.add(rated.value_counts(), fill_value=0)
+                    ratings_with_books.to_csv(spool, header=i == 0, index=False)
+            del books
+
+            popular = title_counts[title_counts >= self.data_validation_config.min_book_ratings].astype(np.int64)
+            written = set()
+            n_rows = 0
+            with CleanDataWriter(self.get_clean_data_path(), self.dtype_config) as writer:
+                # every value is read back as the text written above so it is written out unchanged
+                for chunk in pd.read_csv(spool_path, dtype=str, chunksize=chunk_size):
+                    chunk["total_ratings"] = chunk["title"].map(popular)
+                    chunk = chunk[chunk["total_ratings"].notna()].astype({"total_ratings": np.int64})
+                    keys = chunk["user_id"] + "\x00" + chunk["title"]
+                    keep = ~keys.duplicated() & ~keys.isin(written)
+                    written.update(keys[keep])
+                    writer.write(chunk[keep])
+                    n_rows += int(keep.sum())
+            logger.info(f"Shape of final cleaned dataset: ({n_rows}, {len(chunk.columns)})")
+            record_counts(ratings_rows=int(user_counts.sum()), clean_rows=n_rows, active_users=len(active_users), chunk_size=chunk_size)
+            logger.info(f"Saved {os.path.basename(self.get_clean_data_path())} into : {clean_data_dir}")
+
+            self.save_incremental_state(user_counts, spool_path)
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("data_validation")
     def initiate_data_validation(self):
         try:
             logger.info(f"{"="*20} Data Validation Started {"="*20}")
-            self.preprocess_data()
+            if self.data_validation_config.processing_mode == "streaming":
+                self.stream_preprocess_data()
+            else:
+                self.preprocess_data()
             logger.info(f"{"="*20} Data Validation Completed {"="*20}")
         except Exception as e:
             logger.error(e)
@@ -0,0 +1,266 @@
+# INCREMENTAL UPDATE (stages 2 to 4 on a delta of new ratings)
+
+import os
+import sys
+import pickle
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from book_recommender.config.configuration import AppConfiguration
+from book_recommender.logging.log import logger
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.components.data_validation import DataValidation
+from book_recommender.components.data_transformation import DataTransformation
+from book_recommender.components.model_trainer import ModelTrainer
+from book_recommender.utils.artifact_bundle import load_serving_bundle, csr_from_bundle
+from book_recommender.utils.artifact_registry import ArtifactRegistry
+from book_recommender.utils.neighbours import top_k_cosine_neighbours, patch_neighbour_table
+from book_recommender.utils.neighbour_index import build_neighbour_index, ItemSimilarityIndex
+from book_recommender.utils.title_search import build_title_search_arrays
+from book_recommender.utils.dtype_policy import estimator_dtype
+from book_recommender.utils.instrumentation import instrument, record_counts, configure_instrumentation
+
+class IncrementalUpdate:
+    """
+    Applies a file of new ratings without re-running the full pipeline:
+    user counts and the active ratings are updated from the saved state, the
+    sparse matrix is rebuilt from them, only the affected neighbour lists are
+    recomputed and the result is published as a new artifact registry version.
+    """
+    def __init__(self, app_config = None):
+        try:
+            app_config = app_config or AppConfiguration()
+            self.incremental_config = app_config.get_incremental_config()
+            self.data_validation_config = app_config.get_data_validation_config()
+            self.model_trainer_config = app_config.get_model_trainer_config()
+            artifact_registry_config = app_config.get_artifact_registry_config()
+            self.artifact_registry = ArtifactRegistry(artifact_registry_config.registry_dir, artifact_registry_config.keep_versions)
+            self.data_validation = DataValidation(app_config)
+            self.data_transformation = DataTransformation(app_config)
+            self.model_trainer = ModelTrainer(app_config)
+            configure_instrumentation(app_config.get_instrumentation_config())
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def load_state(self):
+        """
+        returns (user_counts series, active ratings, pending ratings of inactive users)
+        """
+        try:
+            state_dir = self.incremental_config.state_dir
+            with np.load(os.path.join(state_dir, "user_counts.npz")) as counts:
+                user_counts = pd.Series(counts["counts"], index=pd.Index(counts["user_ids"], name="user_id"))
+            active_ratings_path = os.path.join(state_dir, "active_ratings.pkl")
+            if os.path.exists(active_ratings_path):
+                active_ratings = pickle.load(open(active_ratings_path, "rb"))
+            else:
+                # written by the streaming mode of DataValidation
+                text_columns = ["isbn", "title", "author", "year", "publisher", "image_url"]
+                active_ratings = pd.read_csv(os.path.join(state_dir, "active_ratings.csv"),
+                                             dtype={column: str for column in text_columns})
+            pending_ratings = pickle.load(open(os.path.join(state_dir, "pending_ratings.pkl"), "rb"))
+            return user_counts, active_ratings, pending_ratings
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def save_state(self, user_counts, active_ratings, pending_ratings):
+        try:
+            state_dir = self.incremental_config.state_dir
+            os.makedirs(state_dir, exist_ok=True)
+            files = {
+                "active_ratings.pkl": active_ratings,
+                "pending_ratings.pkl": pending_ratings
+            }
+            for file_name, obj in files.items():
+                tmp_path = os.path.join(state_dir, f".{file_name}.tmp")
+                pickle.dump(obj, open(tmp_path, "wb"))
+                os.replace(tmp_path, os.path.join(state_dir, file_name))
+            if os.path.exists(os.path.join(state_dir, "active_ratings.csv")):
+                os.remove(os.path.join(state_dir, "active_ratings.csv"))
+
+            tmp_path = os.path.join(state_dir, ".user_counts.tmp.npz")
+            np.savez(tmp_path, user_ids=user_counts.index.to_numpy(dtype=np.int64), counts=user_counts.to_numpy(dtype=np.int64))
+            os.replace(tmp_path, os.path.join(state_dir, "user_counts.npz"))
+            logger.info(f"Saved incremental training state to : {state_dir}")
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def read_user_history(self, user_ids):
+        """
+        Streams the raw ratings csv and returns the ratings of the given users,
+        needed when users cross the activity threshold
+        """
+        try:
+            history = []
+            chunks = pd.read_csv(self.data_validation_config.ratings_csv_file, sep=";", on_bad_lines="skip",
+                                 encoding="latin-1", dtype={"ISBN": str}, chunksize=500_000)
+            for chunk in chunks:
+                chunk = chunk.rename(columns={"User-ID": "user_id", "ISBN": "isbn", "Book-Rating": "rating"})
+                history.append(chunk[chunk["user_id"].isin(user_ids)])
+            return pd.concat(history, ignore_index=True)
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def update_active_ratings(self, delta, user_counts, active_ratings, pending_ratings):
+        """
+        Adds the delta to the user counts and moves ratings of active users
+        (at least min_user_ratings ratings) into the active ratings
+        returns the updated (user_counts, active_ratings, pending_ratings)
+        """
+        try:
+            min_user_ratings = self.data_validation_config.min_user_ratings
+            new_counts = user_counts.add(delta["user_id"].value_counts(), fill_value=0).astype(np.int64)
+            was_active = user_counts.index[user_counts >= min_user_ratings]
+            now_active = new_counts.index[new_counts >= min_user_ratings]
+            newly_active = now_active.difference(was_active)
+            logger.info(f"Delta of {len(delta)} ratings, {len(newly_active)} users became active")
+
+            # users crossing the threshold bring their whole history, kept in the order a full rebuild sees it
+            new_rows = [delta.iloc[0:0]]
+            if len(newly_active):
+                new_rows.append(self.read_user_history(newly_active))
+                new_rows.append(pending_ratings[pending_ratings["user_id"].isin(newly_active)])
+            new_rows.append(delta[delta["user_id"].isin(now_active)])
+            new_rows = pd.concat(new_rows, ignore_index=True)
+
+            pending_ratings = pd.concat([
+                pending_ratings[~pending_ratings["user_id"].isin(newly_active)],
+                delta[~delta["user_id"].isin(now_active)][["user_id", "isbn", "rating"]]
+            ], ignore_index=True)
+
+            books = self.data_validation.read_books()
+            active_ratings = pd.concat([active_ratings, new_rows.merge(books, on="isbn")], ignore_index=True)
+            return new_counts, active_ratings, pending_ratings
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def get_base_version_dir(self) -> str:
+        """
+        Version the neighbour table is patched from: the served (CURRENT) version, so a
+        version that was rolled back from is never built upon. Rows are recomputed
+        wherever the rebuilt matrix differs from the base, any version is a valid base.
+        Before the first promotion the newest version, or the bundle of the last full training run
+        """
+        versions = self.artifact_registry.list_versions()
+        current = self.artifact_registry.current_version()
+        if current is not None:
+            if versions and versions[-1] != current:
+                logger.warning(f"Applying the delta to the served version {current}, not to the newer version {versions[-1]}. "
+                               f"Ratings of deltas applied after {current} are still part of the incremental state")
+            return self.artifact_registry.version_dir(current)
+        if versions:
+            return self.artifact_registry.version_dir(versions[-1])
+        return self.model_trainer_config.serving_bundle_dir
+
+    @instrument("incremental_update.get_neighbour_table")
+    def get_neighbour_table(self, book_sparse, titles, users):
+        """
+        Maps the previous version's neighbour table onto the new rows and patches
+        the rows affected by the delta, falls back to a full computation when
+        there is no usable previous version
+        returns (indices, distances, metadata dict)
+        """
+        try:
+            k = min(self.model_trainer_config.neighbours_top_k, book_sparse.shape[0])
+            block_size = self.model_trainer_config.neighbours_block_size
+            n_jobs = self.model_trainer_config.neighbours_n_jobs
+            previous_dir = self.get_base_version_dir()
+            try:
+                arrays, manifest = load_serving_bundle(previous_dir, mmap_mode=None)
+            except AppException:
+                arrays = {}
+            if "users" not in arrays or arrays["neighbour_indices"].shape[1] != k:
+                logger.info(f"No usable previous version in {previous_dir}, computing the full neighbour table")
+                indices, distances = top_k_cosine_neighbours(book_sparse, k, block_size, n_jobs=n_jobs)
+                return indices, distances, {"base_version": None, "recomputed_rows": int(book_sparse.shape[0])}
+
+            # old row / column ids -> new ones (-1 when they disappeared)
+            old_titles, old_users = arrays["titles"], arrays["users"]
+            title_pos = np.minimum(np.searchsorted(titles, old_titles), len(titles) - 1)
+            old_to_new = np.where(titles[title_pos] == old_titles, title_pos, -1)
+            user_pos = np.minimum(np.searchsorted(users, old_users), len(users) - 1)
+            user_found = users[user_pos] == old_users
+
+            old_matrix = csr_from_bundle(arrays, "matrix", manifest["metadata"]["matrix_shape"]).tocoo()
+            keep = (old_to_new[old_matrix.row] >= 0) & user_found[old_matrix.col]
+            old_in_new = coo_matrix(
+                (old_matrix.data[keep], (old_to_new[old_matrix.row[keep]], user_pos[old_matrix.col[keep]])),
+                shape=book_sparse.shape
+            ).tocsr()
+            changed = (book_sparse - old_in_new).tocsr()
+            changed.eliminate_zeros()
+
+            present = np.zeros(book_sparse.shape[0], dtype=bool)
+            present[old_to_new[old_to_new >= 0]] = True
+            affected = (np.diff(changed.indptr) > 0) | ~present
+
+            indices = np.full((book_sparse.shape[0], k), -1, dtype=np.int32)
+            distances = np.zeros((book_sparse.shape[0], k), dtype=np.float32)
+            moved = old_to_new >= 0
+            old_indices = arrays["neighbour_indices"][moved]
+            indices[old_to_new[moved]] = np.where(old_indices >= 0, old_to_new[old_indices], -1)
+            distances[old_to_new[moved]] = arrays["neighbour_distances"][moved]
+
+            indices, distances, recomputed = patch_neighbour_table(book_sparse, indices, distances, affected, block_size, n_jobs)
+            return indices, distances, {"base_version": os.path.basename(os.path.normpath(previous_dir)),
+                                        "affected_rows": int(affected.sum()), "recomputed_rows": int(recomputed)}
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("incremental_update")
+    def initiate_incremental_update(self, ratings_file: str) -> str:
+        """
+        ratings_file: csv of new ratings in the ratings.csv format (User-ID;ISBN;Book-Rating)
+        returns the directory of the new artifact version
+        """
+        try:
+            logger.info(f"{"="*20} Incremental Update Started {"="*20}")
+            delta = self.data_validation.read_ratings(ratings_file)
+            record_counts(delta_rows=len(delta))
+            user_counts, active_ratings, pending_ratings = self.load_state()
+            user_counts, active_ratings, pending_ratings = self.update_active_ratings(delta, user_counts, active_ratings, pending_ratings)
+
+            final_ratings = self.data_validation.filter_popular_books(active_ratings)
+            book_sparse, book_names, user_ids = self.data_transformation.build_sparse_pivot(final_ratings)
+            logger.info(f"book_pivot sparse shape : {book_sparse.shape}, non zero ratings : {book_sparse.nnz}")
+            titles = np.asarray(book_names, dtype=str)
+            users = np.asarray(user_ids, dtype=self.data_transformation.dtype_config.index_dtype)
+            _, poster_index = self.data_transformation.get_lookup_indexes(final_ratings, book_names)
+            posters = np.asarray([poster_index.get(title, "") for title in book_names], dtype=str)
+
+            indices, distances, patch_info = self.get_neighbour_table(book_sparse, titles, users)
+            model = build_neighbour_index(self.model_trainer_config.index_backend, self.model_trainer.get_index_params())
+            if isinstance(model, ItemSimilarityIndex):
+                # the patched table is the new graph, no full similarity product
+                model.set_neighbour_table(indices, distances)
+            else:
+                model.fit(book_sparse.astype(estimator_dtype(self.data_transformation.dtype_config.rating_dtype)))
+
+            popularity = final_ratings["title"].value_counts().reindex(book_names, fill_value=0).to_numpy()
+            search_arrays = build_title_search_arrays(book_names, popularity)
+
+            arrays, metadata = self.model_trainer.get_serving_bundle_arrays(titles, posters, users, book_sparse, model,
+                                                                            indices, distances, search_arrays)
+            metadata.update(patch_info)
+            record_counts(matrix_shape=book_sparse.shape, **{name: value for name, value in patch_info.items() if name.endswith("_rows")})
+            metadata.update({"source": "incremental", "delta_file": os.path.abspath(ratings_file)})
+            version_dir = self.artifact_registry.version_dir(self.model_trainer.publish_version(arrays, metadata, model))
+
+            self.save_state(user_counts, active_ratings, pending_ratings)
+            logger.info(f"{"="*20} Incremental Update Completed {"="*20}")
+            return version_dir
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
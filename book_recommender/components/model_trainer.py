@@ -2,37 +2,71 @@
 
 import os
 import sys
+import json
 import pickle 
-from sklearn.neighbors import NearestNeighbors
-from scipy.sparse import csr_matrix
+import numpy as np
+from scipy.sparse import csr_matrix, load_npz
 from book_recommender.config.configuration import AppConfiguration
 from book_recommender.logging.log import logger
 from book_recommender.exception.exception_handler import AppException
+from book_recommender.utils.neighbours import top_k_cosine_neighbours, user_top_n
+from book_recommender.utils.artifact_bundle import save_serving_bundle, csr_to_bundle_arrays
+from book_recommender.utils.artifact_registry import ArtifactRegistry
+from book_recommender.utils.neighbour_index import build_neighbour_index, recall_at_k, ItemSimilarityIndex
+from book_recommender.utils.dtype_policy import estimator_dtype, save_dtype_report
+from book_recommender.utils.instrumentation import instrument, record_counts
 
 class ModelTrainer:
-    def __init__(self, app_config = AppConfiguration()):
+    def __init__(self, app_config = None):
         try:
+            app_config = app_config or AppConfiguration()
             self.model_trainer_config = app_config.get_model_trainer_config()
             self.data_transformation_config = app_config.get_data_transformation_config()
+            self.dtype_config = app_config.get_dtype_config()
+            self.artifact_registry_config = app_config.get_artifact_registry_config()
         except Exception as e:
             logger.error(e)
             raise AppException(e, sys) from e
         
+    def get_index_params(self) -> dict:
+        """
+        parameters of the configured index backend, the item similarity
+        model keeps as many neighbours per title as the neighbour table
+        """
+        if self.model_trainer_config.index_backend == ItemSimilarityIndex.backend:
+            return {"top_k": self.model_trainer_config.neighbours_top_k,
+                    "block_size": self.model_trainer_config.neighbours_block_size,
+                    "n_jobs": self.model_trainer_config.neighbours_n_jobs}
+        return self.model_trainer_config.index_params
+
+    @instrument("model_trainer.train")
     def train(self):
         """
         trains the nearest neighbors model on a csr matrix
+        the index backend (exact brute force, approximate ivf or the exact item similarity graph) comes from config.yaml
+        returns (book_sparse, model)
         """
         try:
             # load pivot data
-            pivot_path = os.path.join(self.data_transformation_config.transformed_data_dir, "book_pivot.pkl")
-            logger.info(f"Loading pivot matrix from: {pivot_path}")
-            book_pivot = pickle.load(open(pivot_path, "rb"))
-            logger.info(f"Type of loaded object: {type(book_pivot)}")
-            book_sparse = csr_matrix(book_pivot)
+            if self.data_transformation_config.transformation_mode == "sparse":
+                pivot_path = os.path.join(self.data_transformation_config.transformed_data_dir, "book_pivot.npz")
+                logger.info(f"Loading sparse pivot matrix from: {pivot_path}")
+                book_sparse = load_npz(pivot_path).tocsr()
+            else:
+                pivot_path = os.path.join(self.data_transformation_config.transformed_data_dir, "book_pivot.pkl")
+                logger.info(f"Loading pivot matrix from: {pivot_path}")
+                book_pivot = pickle.load(open(pivot_path, "rb"))
+                logger.info(f"Type of loaded object: {type(book_pivot)}")
+                book_sparse = csr_matrix(book_pivot)
+
+            record_counts(matrix_shape=book_sparse.shape, matrix_nnz=book_sparse.nnz)
 
             # train the model
-            model = NearestNeighbors(algorithm="brute", metric="cosine")
-            model.fit(book_sparse)
+            index_backend = self.model_trainer_config.index_backend
+            model = build_neighbour_index(index_backend, self.get_index_params())
+            # estimators get float ratings, the compact matrix itself goes into the serving bundle
+            fit_dtype = estimator_dtype(self.dtype_config.rating_dtype)
+            model.fit(book_sparse if book_sparse.dtype == fit_dtype else book_sparse.astype(fit_dtype))
 
             # save model object for recommendations
             os.makedirs(self.model_trainer_config.trained_model_dir, exist_ok=True)
@@ -40,14 +74,149 @@ class ModelTrainer:
             pickle.dump(model, open(model_path, "wb"))
             logger.info(f"Saving final model to : {model_path}")
 
+            # approximate indexes report how close they get to brute force
+            if index_backend not in ("brute", ItemSimilarityIndex.backend):
+                report = recall_at_k(model, book_sparse, k=5, sample_size=self.model_trainer_config.recall_eval_sample)
+                report.update({"index_backend": index_backend, "index_params": model.get_params()})
+                report_path = os.path.join(self.model_trainer_config.trained_model_dir, "index_report.json")
+                with open(report_path, "w") as f:
+                    json.dump(report, f, indent=2)
+                logger.info(f"Saving index recall report to : {report_path}")
+
+            return book_sparse, model
+
         except Exception as e:
             logger.error(e)
             raise AppException(e, sys) from e
         
+    @instrument("model_trainer.compute_neighbour_table")
+    def compute_neighbour_table(self, book_sparse, model=None):
+        """
+        precomputes the top-k cosine neighbours of every title so serving is a lookup
+        book_sparse : csr matrix the model was trained on
+        model : fitted index, the item similarity graph already is the table
+        """
+        try:
+            if isinstance(model, ItemSimilarityIndex):
+                indices, distances = model.neighbour_table()
+            else:
+                indices, distances = top_k_cosine_neighbours(
+                    book_sparse,
+                    k=self.model_trainer_config.neighbours_top_k,
+                    block_size=self.model_trainer_config.neighbours_block_size,
+                    n_jobs=self.model_trainer_config.neighbours_n_jobs
+                )
+
+            neighbours_path = os.path.join(self.model_trainer_config.trained_model_dir, self.model_trainer_config.neighbours_file_name)
+            np.savez(neighbours_path, indices=indices, distances=distances)
+            logger.info(f"Saving neighbour table of shape {indices.shape} to : {neighbours_path}")
+            record_counts(neighbours_shape=indices.shape)
+
+            return indices, distances
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+        
+    @instrument("model_trainer.get_user_arrays")
+    def get_user_arrays(self, book_sparse, indices, distances) -> dict:
+        """
+        per user index of the rated titles: book_sparse in csc form, stored as the
+        csr arrays of its transpose (users x titles) so a user's ratings are one slice,
+        plus the precomputed top user_top_n titles of every user
+        """
+        try:
+            user_ratings = book_sparse.tocsc().T
+            arrays = csr_to_bundle_arrays(user_ratings, "user_ratings")
+            if self.model_trainer_config.user_top_n > 0:
+                top_rows, top_scores = user_top_n(user_ratings, indices, distances, self.model_trainer_config.user_top_n)
+                arrays.update({"user_top_rows": top_rows, "user_top_scores": top_scores})
+                logger.info(f"Precomputed the top {self.model_trainer_config.user_top_n} titles of {user_ratings.shape[0]} users")
+            record_counts(users=user_ratings.shape[0])
+            return arrays
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def get_serving_bundle_arrays(self, titles, posters, users, book_sparse, model, indices, distances, search_arrays):
+        """
+        arrays and manifest metadata of a serving bundle
+        search_arrays: title search index arrays (search_*)
+        returns (arrays, metadata)
+        """
+        arrays = {
+            "titles": titles,
+            "title_order": np.argsort(titles, kind="stable").astype(np.int32),
+            "posters": posters,
+            "users": users,
+            "neighbour_indices": indices,
+            "neighbour_distances": distances,
+            **csr_to_bundle_arrays(book_sparse, "matrix"),
+            **self.get_user_arrays(book_sparse, indices, distances),
+            **search_arrays
+        }
+        metadata = {"matrix_shape": list(book_sparse.shape), "index_backend": self.model_trainer_config.index_backend}
+        # approximate indexes are stored as plain arrays as well
+        if hasattr(model, "to_arrays"):
+            arrays.update(model.to_arrays())
+            metadata["index_params"] = model.get_params()
+        return arrays, metadata
+
+    @instrument("model_trainer.publish_version")
+    def publish_version(self, arrays, metadata, model) -> str:
+        """
+        publishes the serving bundle arrays and the model as a new version of the
+        artifact registry, served right away with auto_promote
+        returns the version
+        """
+        try:
+            registry = ArtifactRegistry(self.artifact_registry_config.registry_dir, self.artifact_registry_config.keep_versions)
+            version = registry.publish(arrays, metadata, model)
+            if self.artifact_registry_config.auto_promote:
+                registry.promote(version)
+            return version
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("model_trainer.export_serving_bundle")
+    def export_serving_bundle(self, book_sparse, model, indices, distances):
+        """
+        writes the pickle free, memory mappable serving bundle
+        (titles, posters, user ids, csr matrix, neighbour table and title search index as .npy files + manifest.json)
+        and publishes it together with the model as a registry version
+        """
+        try:
+            transformed_data_dir = self.data_transformation_config.transformed_data_dir
+            titles = np.load(os.path.join(transformed_data_dir, "book_titles.npy"))
+            posters = np.load(os.path.join(transformed_data_dir, "book_posters.npy"))
+            users = np.load(os.path.join(transformed_data_dir, "book_users.npy"))
+            with np.load(os.path.join(transformed_data_dir, "title_search.npz")) as search_file:
+                search_arrays = {name: search_file[name] for name in search_file.files}
+
+            arrays, metadata = self.get_serving_bundle_arrays(titles, posters, users, book_sparse, model, indices, distances, search_arrays)
+            save_serving_bundle(self.model_trainer_config.serving_bundle_dir, arrays, metadata=metadata)
+            self.publish_version(arrays, {**metadata, "source": "training"}, model)
+
+            report_artifacts = {"serving_bundle/matrix": book_sparse, "serving_bundle/users": users}
+            if getattr(model, "_fit_X", None) is not None or getattr(model, "matrix", None) is not None:
+                report_artifacts[self.model_trainer_config.trained_model_name] = model
+            save_dtype_report(os.path.join(self.model_trainer_config.trained_model_dir, "dtype_report.json"),
+                              report_artifacts, self.dtype_config)
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("model_trainer")
     def initiate_model_training(self):
         try:
             logger.info(f"{"="*20} Model Training Started {"="*20}")
-            self.train()
+            book_sparse, model = self.train()
+            indices, distances = self.compute_neighbour_table(book_sparse, model)
+            self.export_serving_bundle(book_sparse, model, indices, distances)
             logger.info(f"{"="*20} Model Training Completed {"="*20}")
 
         except Exception as e:
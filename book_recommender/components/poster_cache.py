@@ -0,0 +1,129 @@
+# STAGE 5
+
+import os
+import sys
+import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from book_recommender.logging.log import logger
+from book_recommender.config.configuration import AppConfiguration
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.utils.poster_images import RateLimiter, fetch_image, make_thumbnail, store_thumbnail
+from book_recommender.utils.instrumentation import instrument, record_counts
+
+class PosterCache:
+    """
+    Checks the poster url of every title offline, downloads the posters concurrently
+    and keeps resized thumbnails in a content addressed cache (thumbnails/ab/<sha256>.jpg).
+    url_status.json remembers the outcome of every url so a re-run only retries
+    urls that failed, and thumbnails.npz maps each title to its thumbnail for serving.
+    """
+    def __init__(self, app_config = None):
+        try:
+            app_config = app_config or AppConfiguration()
+            self.poster_cache_config = app_config.get_poster_cache_config()
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def load_url_status(self) -> dict:
+        """
+        url -> {"status": "ok" | "missing" | "failed", "thumbnail": relative path or ""}
+        """
+        path = os.path.join(self.poster_cache_config.poster_cache_dir, "url_status.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r") as f:
+            url_status = json.load(f)
+        # thumbnails removed from disk are downloaded again
+        thumbnails_dir = self.poster_cache_config.thumbnails_dir
+        return {url: entry for url, entry in url_status.items()
+                if entry["status"] != "ok" or os.path.exists(os.path.join(thumbnails_dir, entry["thumbnail"]))}
+
+    def write_json(self, file_name: str, content: dict):
+        path = os.path.join(self.poster_cache_config.poster_cache_dir, file_name)
+        tmp_path = os.path.join(self.poster_cache_config.poster_cache_dir, f".{file_name}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(content, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def cache_poster(self, url: str, rate_limiter: RateLimiter) -> dict:
+        """
+        Downloads and resizes one poster, returns its url_status.json entry
+        """
+        config = self.poster_cache_config
+        status, data = fetch_image(url, config.timeout_seconds, config.max_retries, config.backoff_seconds, rate_limiter)
+        if status != "ok":
+            return {"status": status, "thumbnail": ""}
+        thumbnail = make_thumbnail(data, (config.thumbnail_width, config.thumbnail_height))
+        if thumbnail is None:
+            return {"status": "missing", "thumbnail": ""}
+        return {"status": "ok", "thumbnail": store_thumbnail(config.thumbnails_dir, thumbnail)}
+
+    @instrument("poster_cache.download_posters")
+    def download_posters(self, urls: list) -> dict:
+        """
+        Downloads every url not settled by a previous run on a bounded thread pool
+        returns url -> url_status.json entry for all urls
+        """
+        try:
+            config = self.poster_cache_config
+            url_status = self.load_url_status()
+            pending = [url for url in urls if url_status.get(url, {}).get("status") not in ("ok", "missing")]
+            logger.info(f"Poster urls : {len(urls)}, already settled : {len(urls) - len(pending)}, to download : {len(pending)}")
+
+            rate_limiter = RateLimiter(config.requests_per_second)
+            with ThreadPoolExecutor(max_workers=config.max_workers) as executor:
+                for done, (url, entry) in enumerate(zip(pending, executor.map(lambda url: self.cache_poster(url, rate_limiter), pending)), 1):
+                    url_status[url] = entry
+                    # checkpoint so an interrupted run resumes where it stopped
+                    if done % 500 == 0:
+                        self.write_json("url_status.json", url_status)
+                        logger.info(f"Downloaded {done} / {len(pending)} posters")
+
+            self.write_json("url_status.json", url_status)
+            record_counts(urls=len(urls), downloaded=len(pending))
+            return url_status
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("poster_cache.initiate_poster_cache")
+    def initiate_poster_cache(self):
+        """
+        Caches the poster of every title and writes the thumbnails.npz manifest
+        (titles, title_order and thumbnail paths relative to thumbnails/, "" without a poster)
+        """
+        try:
+            config = self.poster_cache_config
+            os.makedirs(config.thumbnails_dir, exist_ok=True)
+            titles = np.load(os.path.join(config.transformed_data_dir, "book_titles.npy"))
+            posters = np.load(os.path.join(config.transformed_data_dir, "book_posters.npy"))
+
+            urls = sorted({str(url) for url in posters if url})
+            url_status = self.download_posters(urls)
+            thumbnails = np.asarray([url_status[url]["thumbnail"] if url else "" for url in posters.tolist()], dtype=str)
+
+            manifest_path = os.path.join(config.poster_cache_dir, "thumbnails.npz")
+            tmp_path = os.path.join(config.poster_cache_dir, ".thumbnails.tmp.npz")
+            np.savez(tmp_path, titles=titles, title_order=np.argsort(titles, kind="stable").astype(np.int32), thumbnails=thumbnails)
+            os.replace(tmp_path, manifest_path)
+
+            statuses = [url_status[url]["status"] for url in urls]
+            report = {
+                "titles": len(titles),
+                "titles_with_thumbnail": int(np.count_nonzero(thumbnails)),
+                "urls": len(urls),
+                "ok": statuses.count("ok"),
+                "missing": statuses.count("missing"),
+                "failed": statuses.count("failed"),
+                "unique_thumbnails": len({url_status[url]["thumbnail"] for url in urls} - {""})
+            }
+            self.write_json("report.json", report)
+            record_counts(titles=len(titles), titles_with_thumbnail=report["titles_with_thumbnail"], failed=report["failed"])
+            logger.info(f"Saved thumbnails.npz to : {manifest_path}, report : {report}")
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
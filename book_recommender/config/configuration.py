@@ -6,6 +6,9 @@ from book_recommender.exception.exception_handler import AppException
 from book_recommender.entity.config_entity import DataIngestionConfig, DataValidationConfig
 from book_recommender.entity.config_entity import DataTransformationConfig, ModelTrainerConfig
 from book_recommender.entity.config_entity import ModelRecommendationConfig, PreTrainedConfig
+from book_recommender.entity.config_entity import IncrementalConfig, StageCacheConfig, HttpApiConfig
+from book_recommender.entity.config_entity import ResultCacheConfig, InstrumentationConfig, PosterCacheConfig
+from book_recommender.entity.config_entity import DtypeConfig, ArtifactRegistryConfig
 from book_recommender.constant import CONFIG_FILE_PATH
 
 class AppConfiguration:
@@ -19,6 +22,7 @@ class AppConfiguration:
     def get_data_ingestion_config(self) -> DataIngestionConfig:
         try:
             data_ingestion_config = self.configs_info["data_ingestion_config"]
+            data_validation_config = self.configs_info["data_validation_config"]
             artifacts_dir = self.configs_info["artifacts_config"]["artifacts_dir"]
             dataset_dir = data_ingestion_config["dataset_dir"]
 
@@ -28,7 +32,13 @@ class AppConfiguration:
             response = DataIngestionConfig(
                 dataset_download_url = data_ingestion_config["dataset_download_url"],
                 ingested_dir = ingested_data_dir,
-                raw_data_dir = raw_data_dir 
+                raw_data_dir = raw_data_dir,
+                dataset_sha256 = data_ingestion_config["dataset_sha256"],
+                download_chunk_size = data_ingestion_config["download_chunk_size_kb"] * 1024,
+                download_max_retries = data_ingestion_config["download_max_retries"],
+                download_timeout_seconds = data_ingestion_config["download_timeout_seconds"],
+                # only the csv files data validation reads are extracted
+                extract_members = [data_validation_config["books_csv_file"], data_validation_config["ratings_csv_file"]]
             )
 
             logger.info(f"Data Ingestion Config : {response}")
@@ -58,12 +68,20 @@ class AppConfiguration:
                                                 ratings_csv_file)
             clean_data_dir = os.path.join(artifacts_dir, dataset_dir, data_validation_config["clean_data_dir"])
             serialized_objects_dir = os.path.join(artifacts_dir, data_validation_config["serialized_objects_dir"])
+            incremental_config = self.configs_info["incremental_config"]
+            incremental_state_dir = os.path.join(artifacts_dir, incremental_config["incremental_dir"], incremental_config["state_dir"])
 
             response = DataValidationConfig(
                 clean_data_dir = clean_data_dir,
                 books_csv_file = books_csv_file_dir,
                 ratings_csv_file = ratings_csv_file_dir,
-                serialized_objects_dir = serialized_objects_dir
+                serialized_objects_dir = serialized_objects_dir,
+                min_user_ratings = data_validation_config["min_user_ratings"],
+                min_book_ratings = data_validation_config["min_book_ratings"],
+                incremental_state_dir = incremental_state_dir,
+                processing_mode = data_validation_config["processing_mode"],
+                memory_budget_mb = data_validation_config["memory_budget_mb"],
+                clean_data_format = data_validation_config["clean_data_format"]
             )
             logger.info(f"Data Validation Config: {response}")
             return response
@@ -72,6 +90,26 @@ class AppConfiguration:
             logger.error(e)
             raise AppException(e, sys) from e
         
+    def get_dtype_config(self) -> DtypeConfig:
+        try:
+            dtype_config = self.configs_info["dtype_config"]
+
+            response = DtypeConfig(
+                rating_dtype = dtype_config["rating_dtype"],
+                index_dtype = dtype_config["index_dtype"],
+                text_dtype = dtype_config["text_dtype"]
+            )
+            # imported here, the policy pulls in numpy and the configuration is read before it is needed
+            from book_recommender.utils.dtype_policy import check_dtype_config
+            check_dtype_config(response)
+
+            logger.info(f"Dtype Config : {response}")
+            return response
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
     def get_data_transformation_config(self) -> DataTransformationConfig:
         try:
             data_transformation_config = self.configs_info["data_transformation_config"]
@@ -80,12 +118,14 @@ class AppConfiguration:
             dataset_dir = data_ingestion_config["dataset_dir"]
             artifacts_dir = self.configs_info["artifacts_config"]["artifacts_dir"]
 
-            clean_data_dir = os.path.join(artifacts_dir, dataset_dir, data_validation_config["clean_data_dir"], "clean_data.csv")
+            clean_data_dir = os.path.join(artifacts_dir, dataset_dir, data_validation_config["clean_data_dir"],
+                                          f"clean_data.{data_validation_config["clean_data_format"]}")
             transformed_data_dir = os.path.join(artifacts_dir, dataset_dir, data_transformation_config["transformed_data_dir"])
 
             response = DataTransformationConfig(
                 clean_data_dir = clean_data_dir,
-                transformed_data_dir = transformed_data_dir
+                transformed_data_dir = transformed_data_dir,
+                transformation_mode = data_transformation_config["transformation_mode"]
             )
             
             logger.info(f"Data transformation config : {response}")
@@ -109,7 +149,16 @@ class AppConfiguration:
             response = ModelTrainerConfig(
                 transformed_data_dir = transformed_data_dir,
                 trained_model_dir = trained_model_dir,
-                trained_model_name = trained_model_name
+                trained_model_name = trained_model_name,
+                neighbours_file_name = model_trainer_config["neighbours_file_name"],
+                neighbours_top_k = model_trainer_config["neighbours_top_k"],
+                neighbours_block_size = model_trainer_config["neighbours_block_size"],
+                neighbours_n_jobs = model_trainer_config["neighbours_n_jobs"],
+                serving_bundle_dir = os.path.join(artifacts_dir, model_trainer_config["serving_bundle_dir"]),
+                index_backend = model_trainer_config["index_backend"],
+                index_params = model_trainer_config["index_params"] if model_trainer_config["index_backend"] != "brute" else {},
+                recall_eval_sample = model_trainer_config["recall_eval_sample"],
+                user_top_n = model_trainer_config["user_top_n"]
             )
 
             logger.info(f"Model Trainer Config: {response}")
@@ -131,13 +180,19 @@ class AppConfiguration:
             book_name_serialized_objects = os.path.join(artifacts_dir, data_validation_config["serialized_objects_dir"], "book_names.pkl")
             book_pivot_serialized_objects = os.path.join(artifacts_dir, data_validation_config["serialized_objects_dir"], "book_pivot.pkl")
             final_rating_serialized_objects = os.path.join(artifacts_dir, data_validation_config["serialized_objects_dir"], "final_ratings.pkl")
+            title_index_serialized_objects = os.path.join(artifacts_dir, data_validation_config["serialized_objects_dir"], "title_index.pkl")
+            poster_index_serialized_objects = os.path.join(artifacts_dir, data_validation_config["serialized_objects_dir"], "poster_index.pkl")
             trained_model_path = os.path.join(trained_model_dir, trained_model_name)
+            neighbours_path = os.path.join(trained_model_dir, model_trainer_config["neighbours_file_name"])
 
             response = ModelRecommendationConfig(
                 book_name_serialized_objects = book_name_serialized_objects,
                 book_pivot_serialized_objects = book_pivot_serialized_objects,
                 final_rating_serialized_objects = final_rating_serialized_objects,
-                trained_model_path = trained_model_path
+                title_index_serialized_objects = title_index_serialized_objects,
+                poster_index_serialized_objects = poster_index_serialized_objects,
+                trained_model_path = trained_model_path,
+                neighbours_path = neighbours_path
             )
             
             logger.info(f"Model Recommendation Config: {response}")
@@ -147,6 +202,85 @@ class AppConfiguration:
             logger.error(e)
             raise AppException(e, sys) from e
         
+    def get_incremental_config(self) -> IncrementalConfig:
+        try:
+            incremental_config = self.configs_info["incremental_config"]
+            artifacts_dir = self.configs_info["artifacts_config"]["artifacts_dir"]
+            incremental_dir = os.path.join(artifacts_dir, incremental_config["incremental_dir"])
+
+            response = IncrementalConfig(
+                state_dir = os.path.join(incremental_dir, incremental_config["state_dir"])
+            )
+
+            logger.info(f"Incremental Config: {response}")
+            return response
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def get_artifact_registry_config(self) -> ArtifactRegistryConfig:
+        try:
+            artifact_registry_config = self.configs_info["artifact_registry_config"]
+            artifacts_dir = self.configs_info["artifacts_config"]["artifacts_dir"]
+
+            response = ArtifactRegistryConfig(
+                registry_dir = os.path.join(artifacts_dir, artifact_registry_config["registry_dir"]),
+                keep_versions = artifact_registry_config["keep_versions"],
+                auto_promote = artifact_registry_config["auto_promote"]
+            )
+
+            logger.info(f"Artifact Registry Config : {response}")
+            return response
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def get_poster_cache_config(self) -> PosterCacheConfig:
+        try:
+            poster_cache_config = self.configs_info["poster_cache_config"]
+            artifacts_dir = self.configs_info["artifacts_config"]["artifacts_dir"]
+            dataset_dir = self.configs_info["data_ingestion_config"]["dataset_dir"]
+            transformed_data_dir = os.path.join(artifacts_dir, dataset_dir, self.configs_info["data_transformation_config"]["transformed_data_dir"])
+            poster_cache_dir = os.path.join(artifacts_dir, poster_cache_config["poster_cache_dir"])
+
+            response = PosterCacheConfig(
+                transformed_data_dir = transformed_data_dir,
+                poster_cache_dir = poster_cache_dir,
+                thumbnails_dir = os.path.join(poster_cache_dir, "thumbnails"),
+                thumbnail_width = poster_cache_config["thumbnail_width"],
+                thumbnail_height = poster_cache_config["thumbnail_height"],
+                max_workers = poster_cache_config["max_workers"],
+                requests_per_second = poster_cache_config["requests_per_second"],
+                max_retries = poster_cache_config["max_retries"],
+                backoff_seconds = poster_cache_config["backoff_seconds"],
+                timeout_seconds = poster_cache_config["timeout_seconds"]
+            )
+
+            logger.info(f"Poster Cache Config : {response}")
+            return response
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def get_stage_cache_config(self) -> StageCacheConfig:
+        try:
+            stage_cache_config = self.configs_info["stage_cache_config"]
+            artifacts_dir = self.configs_info["artifacts_config"]["artifacts_dir"]
+
+            response = StageCacheConfig(
+                stage_cache_dir = os.path.join(artifacts_dir, stage_cache_config["stage_cache_dir"])
+            )
+
+            logger.info(f"Stage Cache Config : {response}")
+            return response
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
     def get_pretrained_config(self) -> PreTrainedConfig:
         try:
             pretrained_config = self.configs_info["pretrained_config"]
@@ -155,12 +289,29 @@ class AppConfiguration:
             pretrained_book_names_dir = os.path.join(pretrained_dir, pretrained_config["pretrained_book_names"])
             pretrained_final_ratings_dir = os.path.join(pretrained_dir, pretrained_config["pretrained_final_ratings"])
             pretrained_book_pivot_dir = os.path.join(pretrained_dir, pretrained_config["pretrained_book_pivot"])
+            pretrained_title_index_dir = os.path.join(pretrained_dir, pretrained_config["pretrained_title_index"])
+            pretrained_poster_index_dir = os.path.join(pretrained_dir, pretrained_config["pretrained_poster_index"])
+            pretrained_neighbours_dir = os.path.join(pretrained_dir, pretrained_config["pretrained_neighbours"])
+            pretrained_title_search_dir = os.path.join(pretrained_dir, pretrained_config["pretrained_title_search"])
+            pretrained_poster_cache_dir = os.path.join(pretrained_dir, pretrained_config["pretrained_poster_cache"])
+            pretrained_bundle_dir = os.path.join(pretrained_dir, pretrained_config["pretrained_bundle_dir"])
+            # the registry the pipeline publishes to, not a copy in pretrained_dir
+            pretrained_registry_dir = os.path.join(self.configs_info["artifacts_config"]["artifacts_dir"],
+                                                   self.configs_info["artifact_registry_config"]["registry_dir"])
 
             response = PreTrainedConfig(
                 pretrained_model = pretrained_model_dir,
                 pretrained_book_names = pretrained_book_names_dir,
                 pretrained_final_ratings = pretrained_final_ratings_dir,
-                pretrained_book_pivot = pretrained_book_pivot_dir
+                pretrained_book_pivot = pretrained_book_pivot_dir,
+                pretrained_title_index = pretrained_title_index_dir,
+                pretrained_poster_index = pretrained_poster_index_dir,
+                pretrained_neighbours = pretrained_neighbours_dir,
+                pretrained_title_search = pretrained_title_search_dir,
+                pretrained_poster_cache = pretrained_poster_cache_dir,
+                pretrained_format = pretrained_config["pretrained_format"],
+                pretrained_bundle_dir = pretrained_bundle_dir,
+                pretrained_registry_dir = pretrained_registry_dir
             )
             
             logger.info(f"Pretrained Objects Config: {response}")
@@ -168,4 +319,56 @@ class AppConfiguration:
 
         except Exception as e:
             logger.error(e)
-            raise AppException(e, sys) from e
\ No newline at end of file
+            raise AppException(e, sys) from e
+
+    def get_result_cache_config(self) -> ResultCacheConfig:
+        try:
+            result_cache_config = self.configs_info["result_cache_config"]
+
+            response = ResultCacheConfig(
+                max_entries = result_cache_config["max_entries"],
+                max_bytes = result_cache_config["max_bytes"],
+                ttl_seconds = result_cache_config["ttl_seconds"]
+            )
+
+            logger.info(f"Result Cache Config : {response}")
+            return response
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def get_http_api_config(self) -> HttpApiConfig:
+        try:
+            http_api_config = self.configs_info["http_api_config"]
+
+            response = HttpApiConfig(
+                address = http_api_config["address"],
+                port = http_api_config["port"],
+                max_workers = http_api_config["max_workers"],
+                max_k = http_api_config["max_k"],
+                max_batch_size = http_api_config["max_batch_size"]
+            )
+
+            logger.info(f"HTTP API Config : {response}")
+            return response
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def get_instrumentation_config(self) -> InstrumentationConfig:
+        try:
+            instrumentation_config = self.configs_info["instrumentation_config"]
+
+            response = InstrumentationConfig(
+                metrics_log = instrumentation_config["metrics_log"],
+                serving_log_sample_rate = instrumentation_config["serving_log_sample_rate"]
+            )
+
+            logger.info(f"Instrumentation Config : {response}")
+            return response
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
@@ -5,4 +5,7 @@ ROOT_DIR = os.getcwd()
 # main config file path
 CONFIG_DIR = "config"
 CONFIG_FILE = "config.yaml"
-CONFIG_FILE_PATH = os.path.join(ROOT_DIR, CONFIG_DIR, CONFIG_FILE)
\ No newline at end of file
+CONFIG_FILE_PATH = os.path.join(ROOT_DIR, CONFIG_DIR, CONFIG_FILE)
+
+# training pipeline stages in run order
+STAGES = ["data_ingestion", "data_validation", "data_transformation", "model_trainer", "poster_cache"]
\ No newline at end of file
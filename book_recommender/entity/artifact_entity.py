@@ -0,0 +1,7 @@
+from collections import namedtuple
+
+ServingArtifacts = namedtuple("ServingArtifacts",
+                              ["model", "book_matrix", "book_names", "title_index",
+                               "poster_index", "neighbours", "title_search", "thumbnails",
+                               "users", "user_ratings", "user_top",
+                               "version", "bundle_version", "loaded_at", "load_time", "memory_bytes"])
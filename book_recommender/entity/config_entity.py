@@ -1,22 +1,65 @@
 from collections import namedtuple
 
 DataIngestionConfig = namedtuple("DatasetConfig",
-                                ["dataset_download_url", "raw_data_dir", "ingested_dir"])
+                                ["dataset_download_url", "raw_data_dir", "ingested_dir",
+                                 "dataset_sha256", "download_chunk_size", "download_max_retries",
+                                 "download_timeout_seconds", "extract_members"])
 
 DataValidationConfig = namedtuple("DataValidationConfig",
                                  ["clean_data_dir", "books_csv_file",
-                                  "ratings_csv_file", "serialized_objects_dir"])
+                                  "ratings_csv_file", "serialized_objects_dir",
+                                  "min_user_ratings", "min_book_ratings",
+                                  "incremental_state_dir", "processing_mode",
+                                  "memory_budget_mb", "clean_data_format"])
 
 DataTransformationConfig = namedtuple("DataTransformationConfig",
-                                      ["clean_data_dir", "transformed_data_dir"])
+                                      ["clean_data_dir", "transformed_data_dir", "transformation_mode"])
 
 ModelTrainerConfig = namedtuple("ModelTrainerConfig",
-                                ["transformed_data_dir", "trained_model_dir", "trained_model_name"])
+                                ["transformed_data_dir", "trained_model_dir", "trained_model_name",
+                                 "neighbours_file_name", "neighbours_top_k", "neighbours_block_size",
+                                 "neighbours_n_jobs",
+                                 "serving_bundle_dir", "index_backend", "index_params",
+                                 "recall_eval_sample", "user_top_n"])
 
 ModelRecommendationConfig = namedtuple("ModelRecommendationConfig",
                                        ["book_name_serialized_objects", "book_pivot_serialized_objects",
-                                        "final_rating_serialized_objects", "trained_model_path"])
+                                        "final_rating_serialized_objects", "title_index_serialized_objects",
+                                        "poster_index_serialized_objects", "trained_model_path",
+                                        "neighbours_path"])
 
 PreTrainedConfig = namedtuple("PreTrainedConfig",
                               ["pretrained_model", "pretrained_book_names",
-                               "pretrained_final_ratings", "pretrained_book_pivot"])
\ No newline at end of file
+                               "pretrained_final_ratings", "pretrained_book_pivot",
+                               "pretrained_title_index", "pretrained_poster_index",
+                               "pretrained_neighbours", "pretrained_title_search",
+                               "pretrained_poster_cache",
+                               "pretrained_format", "pretrained_bundle_dir",
+                               "pretrained_registry_dir"])
+
+IncrementalConfig = namedtuple("IncrementalConfig",
+                               ["state_dir"])
+
+ArtifactRegistryConfig = namedtuple("ArtifactRegistryConfig",
+                                    ["registry_dir", "keep_versions", "auto_promote"])
+
+DtypeConfig = namedtuple("DtypeConfig",
+                         ["rating_dtype", "index_dtype", "text_dtype"])
+
+PosterCacheConfig = namedtuple("PosterCacheConfig",
+                               ["transformed_data_dir", "poster_cache_dir", "thumbnails_dir",
+                                "thumbnail_width", "thumbnail_height", "max_workers",
+                                "requests_per_second", "max_retries", "backoff_seconds",
+                                "timeout_seconds"])
+
+StageCacheConfig = namedtuple("StageCacheConfig",
+                              ["stage_cache_dir"])
+
+HttpApiConfig = namedtuple("HttpApiConfig",
+                           ["address", "port", "max_workers", "max_k", "max_batch_size"])
+
+ResultCacheConfig = namedtuple("ResultCacheConfig",
+                               ["max_entries", "max_bytes", "ttl_seconds"])
+
+InstrumentationConfig = namedtuple("InstrumentationConfig",
+                                   ["metrics_log", "serving_log_sample_rate"])
\ No newline at end of file
@@ -1,5 +1,7 @@
 import os
+import sys
 import logging
+import threading
 from datetime import datetime
 
 def setup_logging():
@@ -30,12 +32,45 @@ def setup_logging():
         force=True  # This ensures the configuration is applied
     )
     
+    # JSON metric records of book_recommender.utils.instrumentation, one object per line in their own file
+    metrics_handler = logging.FileHandler(os.path.join(LOG_DIR, f"metrics_{CURRENT_TIME_STAMP}.jsonl"), delay=True)
+    metrics_handler.setFormatter(logging.Formatter("%(message)s"))
+    metrics_logger = logging.getLogger("book_recommender.metrics")
+    metrics_logger.handlers = [metrics_handler]
+    metrics_logger.setLevel(logging.INFO)
+    metrics_logger.propagate = False
+
     # Create and return logger
     logger = logging.getLogger(__name__)
     logger.info("Logging setup completed successfully")
     
-    print(f"Log file created at: {log_file_path}")
+    # stderr keeps stdout clean for tools that stream results (e.g. batch_recommend.py)
+    print(f"Log file created at: {log_file_path}", file=sys.stderr)
     return logger
 
+_logger = None
+_logger_lock = threading.Lock()
+
+def get_logger():
+    """
+    Returns the logger, setting up logging (and creating the log file) on the first call
+    """
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                _logger = setup_logging()
+    return _logger
+
+
+class LazyLogger:
+    """
+    Stands in for the logger until it is used, importing a module
+    no longer creates a log file, only logging something does
+    """
+    def __getattr__(self, name):
+        return getattr(get_logger(), name)
+
+
 # You can also create a global logger instance
-logger = setup_logging()
\ No newline at end of file
+logger = LazyLogger()
\ No newline at end of file
@@ -0,0 +1,12 @@
+from book_recommender.components.incremental_update import IncrementalUpdate
+
+class IncrementalPipeline:
+    def __init__(self):
+        self.incremental_update = IncrementalUpdate()
+
+    def start_incremental_pipeline(self, ratings_file: str):
+        """
+        Updates the latest artifacts with a file of new ratings
+        :return : directory of the new artifact version
+        """
+        return self.incremental_update.initiate_incremental_update(ratings_file)
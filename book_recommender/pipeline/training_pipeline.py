@@ -1,21 +1,88 @@
+import os
+from book_recommender.config.configuration import AppConfiguration
 from book_recommender.components.data_ingestion import DataIngestion
 from book_recommender.components.data_validation import DataValidation
 from book_recommender.components.data_transformation import DataTransformation
 from book_recommender.components.model_trainer import ModelTrainer
+from book_recommender.components.poster_cache import PosterCache
+from book_recommender.utils.stage_cache import StageCache
+from book_recommender.utils.instrumentation import instrument, configure_instrumentation
+from book_recommender.constant import STAGES
 
 class TrainingPipeline:
-    def __init__(self):
-        self.data_ingestion = DataIngestion()
-        self.data_validation = DataValidation()
-        self.data_transformation = DataTransformation()
-        self.model_trainer = ModelTrainer()
+    def __init__(self, app_config = None):
+        app_config = app_config or AppConfiguration()
+        self.app_config = app_config
+        self.data_ingestion = DataIngestion(app_config)
+        self.data_validation = DataValidation(app_config)
+        self.data_transformation = DataTransformation(app_config)
+        self.model_trainer = ModelTrainer(app_config)
+        self.poster_cache = PosterCache(app_config)
+        self.stage_cache = StageCache(app_config.get_stage_cache_config().stage_cache_dir)
+        configure_instrumentation(app_config.get_instrumentation_config())
 
-    def start_training_pipeline(self):
+    def get_stage_specs(self) -> dict:
         """
-        Starts the training pipeline
-        :return : Nonne
+        stage name -> (run, input paths, config.yaml sections, output paths)
         """
-        self.data_ingestion.initiate_data_ingestion()
-        self.data_validation.initiate_data_validation()
-        self.data_transformation.initiate_data_transformation()
-        self.model_trainer.initiate_model_training()
\ No newline at end of file
+        ingestion_config = self.data_ingestion.data_ingestion_config
+        validation_config = self.data_validation.data_validation_config
+        transformation_config = self.data_transformation.data_transformation_config
+        trainer_config = self.model_trainer.model_trainer_config
+        poster_cache_config = self.poster_cache.poster_cache_config
+        serialized_objects_dir = validation_config.serialized_objects_dir
+
+        return {
+            "data_ingestion": (
+                self.data_ingestion.initiate_data_ingestion,
+                [],
+                ["artifacts_config", "data_ingestion_config"],
+                [ingestion_config.raw_data_dir, ingestion_config.ingested_dir]
+            ),
+            "data_validation": (
+                self.data_validation.initiate_data_validation,
+                [validation_config.books_csv_file, validation_config.ratings_csv_file],
+                ["data_validation_config", "dtype_config"],
+                [validation_config.clean_data_dir] +
+                ([os.path.join(serialized_objects_dir, "final_ratings.pkl")] if validation_config.processing_mode == "memory" else [])
+            ),
+            "data_transformation": (
+                self.data_transformation.initiate_data_transformation,
+                [transformation_config.clean_data_dir],
+                ["data_transformation_config", "dtype_config"],
+                [transformation_config.transformed_data_dir] +
+                [os.path.join(serialized_objects_dir, name) for name in ["book_names.pkl", "title_index.pkl", "poster_index.pkl", "title_search.npz"]]
+            ),
+            "model_trainer": (
+                self.model_trainer.initiate_model_training,
+                [transformation_config.transformed_data_dir],
+                # transformation_mode picks the pivot, keep_versions and auto_promote the publishing
+                ["model_trainer_config", "dtype_config", "data_transformation_config", "artifact_registry_config"],
+                # not the registry dir: promotions, rollbacks and incremental versions change it
+                [trainer_config.trained_model_dir, trainer_config.serving_bundle_dir]
+            ),
+            "poster_cache": (
+                self.poster_cache.initiate_poster_cache,
+                [os.path.join(poster_cache_config.transformed_data_dir, name) for name in ["book_titles.npy", "book_posters.npy"]],
+                ["poster_cache_config"],
+                [os.path.join(poster_cache_config.poster_cache_dir, "thumbnails.npz")]
+            )
+        }
+
+    @instrument("training_pipeline")
+    def start_training_pipeline(self, force: bool = False, from_stage: str = None):
+        """
+        Starts the training pipeline, stages whose inputs and config did not change are skipped
+        force : re-run every stage
+        from_stage : re-run this stage and every stage after it
+        :return : None
+        """
+        if from_stage is not None and from_stage not in STAGES:
+            raise ValueError(f"Unknown stage {from_stage}, expected one of {STAGES}")
+        first_forced = 0 if force else STAGES.index(from_stage) if from_stage else len(STAGES)
+
+        stage_specs = self.get_stage_specs()
+        for position, stage in enumerate(STAGES):
+            run, inputs, sections, outputs = stage_specs[stage]
+            config = {section: self.app_config.configs_info[section] for section in sections}
+            self.stage_cache.run_stage(stage, run, inputs, config, outputs, force=position >= first_forced)
@@ -0,0 +1,61 @@
+import sys
+import json
+import argparse
+from itertools import islice
+from book_recommender.logging.log import logger
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.serving.recommender import BookRecommender
+
+def read_titles(input_file):
+    """
+    Yields one title per non empty line of the input file
+    """
+    for line in input_file:
+        title = line.rstrip("\r\n")
+        if title.strip():
+            yield title
+
+
+def batched(iterable, batch_size: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def run_batch_recommendation(recommender: BookRecommender, input_file, output_file, k: int = 5, batch_size: int = 1024) -> int:
+    """
+    Reads titles from input_file and streams one JSON line of recommendations per title
+    returns the number of titles processed
+    """
+    try:
+        count = 0
+        for titles in batched(read_titles(input_file), batch_size):
+            for result in recommender.recommend_books(titles, k=k):
+                output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output_file.flush()
+            count += len(titles)
+            logger.info(f"Batch recommendations written for {count} titles")
+        return count
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch book recommendations as JSONL")
+    parser.add_argument("--input", default="-", help="file with one book title per line, - for stdin")
+    parser.add_argument("--output", default="-", help="JSONL output file, - for stdout")
+    parser.add_argument("-k", "--k", type=int, default=5, help="recommendations per title")
+    parser.add_argument("--batch-size", type=int, default=1024, help="titles per neighbour search")
+    args = parser.parse_args(argv)
+
+    input_file = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    output_file = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        run_batch_recommendation(BookRecommender(), input_file, output_file, k=args.k, batch_size=args.batch_size)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
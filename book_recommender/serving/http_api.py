@@ -0,0 +1,207 @@
+import sys
+import json
+import math
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import tornado.web
+import tornado.ioloop
+from book_recommender.logging.log import logger
+from book_recommender.config.configuration import AppConfiguration
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.serving.recommender import BookRecommender
+from book_recommender.utils.instrumentation import METRICS
+
+class BaseHandler(tornado.web.RequestHandler):
+    """
+    Shared JSON helpers, the recommendation work runs on the thread pool
+    so the event loop keeps accepting requests
+    """
+    def initialize(self, recommender: BookRecommender, executor: ThreadPoolExecutor, http_api_config):
+        self.recommender = recommender
+        self.executor = executor
+        self.http_api_config = http_api_config
+
+    def write_json(self, content, status: int = 200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps(content, ensure_ascii=False))
+
+    def write_error(self, status_code: int, **kwargs):
+        self.write_json({"error": self._reason}, status=status_code)
+
+    def parse_k(self, value, name: str = "k") -> int:
+        try:
+            k = int(value)
+        except (TypeError, ValueError):
+            raise tornado.web.HTTPError(400, reason=f"{name} must be an integer")
+        if not 1 <= k <= self.http_api_config.max_k:
+            raise tornado.web.HTTPError(400, reason=f"{name} must be between 1 and {self.http_api_config.max_k}")
+        return k
+
+    async def recommend(self, titles, k: int) -> list:
+        return await tornado.ioloop.IOLoop.current().run_in_executor(self.executor, self.recommender.recommend_books, titles, k)
+
+
+class RecommendHandler(BaseHandler):
+    """
+    GET /recommend?title=<title>&k=<k>
+    """
+    async def get(self):
+        title = self.get_query_argument("title", None)
+        if not title:
+            raise tornado.web.HTTPError(400, reason="missing title")
+        k = self.parse_k(self.get_query_argument("k", "5"))
+
+        result = (await self.recommend([title], k))[0]
+        self.write_json(result, status=404 if "error" in result else 200)
+
+
+class BatchRecommendHandler(BaseHandler):
+    """
+    POST /recommend/batch with {"titles": [...], "k": 5}
+    """
+    async def post(self):
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="body must be JSON")
+        titles = body.get("titles") if isinstance(body, dict) else None
+        if not isinstance(titles, list) or not all(isinstance(title, str) for title in titles):
+            raise tornado.web.HTTPError(400, reason="titles must be a list of strings")
+        if len(titles) > self.http_api_config.max_batch_size:
+            raise tornado.web.HTTPError(400, reason=f"at most {self.http_api_config.max_batch_size} titles per request")
+        k = self.parse_k(body.get("k", 5))
+
+        self.write_json({"results": await self.recommend(titles, k)})
+
+
+class SessionRecommendHandler(BaseHandler):
+    """
+    POST /recommend/session with {"titles": [...], "ratings": [...] (optional), "k": 10},
+    one ranked list for all liked titles, the titles themselves excluded
+    """
+    async def post(self):
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="body must be JSON")
+        titles = body.get("titles") if isinstance(body, dict) else None
+        if not isinstance(titles, list) or not titles or not all(isinstance(title, str) for title in titles):
+            raise tornado.web.HTTPError(400, reason="titles must be a non empty list of strings")
+        if len(titles) > self.http_api_config.max_batch_size:
+            raise tornado.web.HTTPError(400, reason=f"at most {self.http_api_config.max_batch_size} titles per request")
+        ratings = body.get("ratings")
+        # json.loads accepts NaN and Infinity, and zero weights would rank titles by nothing
+        if ratings is not None and (not isinstance(ratings, list) or len(ratings) != len(titles) or
+                                    not all(isinstance(rating, (int, float)) and not isinstance(rating, bool)
+                                            and math.isfinite(rating) and rating > 0 for rating in ratings)):
+            raise tornado.web.HTTPError(400, reason="ratings must be a list of positive numbers, one per title")
+        k = self.parse_k(body.get("k", 10))
+
+        result = await tornado.ioloop.IOLoop.current().run_in_executor(
+            self.executor, self.recommender.recommend_session, titles, ratings, k)
+        self.write_json(result, status=404 if len(result["unknown_titles"]) == len(titles) else 200)
+
+
+class UserRecommendHandler(BaseHandler):
+    """
+    GET /recommend/user?user_id=<user_id>&k=<k>, personalized recommendations for a known user
+    """
+    async def get(self):
+        try:
+            user_id = int(self.get_query_argument("user_id", None))
+        except (TypeError, ValueError):
+            raise tornado.web.HTTPError(400, reason="user_id must be an integer")
+        k = self.parse_k(self.get_query_argument("k", "10"))
+        if self.recommender.model_store.get().user_ratings is None:
+            # pickled artifacts have no per user index
+            raise tornado.web.HTTPError(501, reason="user recommendations need a serving bundle (pretrained_format: mmap or registry)")
+
+        result = await tornado.ioloop.IOLoop.current().run_in_executor(
+            self.executor, self.recommender.recommend_for_user, user_id, k)
+        self.write_json(result, status=404 if "error" in result else 200)
+
+
+class SearchHandler(BaseHandler):
+    """
+    GET /search?q=<query>&limit=<limit>, titles for autocompletion
+    """
+    async def get(self):
+        query = self.get_query_argument("q", "")
+        limit = self.parse_k(self.get_query_argument("limit", "10"), name="limit")
+        titles = await tornado.ioloop.IOLoop.current().run_in_executor(self.executor, self.recommender.search_titles, query, limit)
+        self.write_json({"query": query, "titles": titles})
+
+
+class HealthHandler(BaseHandler):
+    """
+    GET /health, version and memory footprint of the loaded artifacts and result cache metrics
+    """
+    def get(self):
+        self.write_json({**self.recommender.model_store.stats(), "result_cache": self.recommender.result_cache.stats()})
+
+
+class MetricsHandler(BaseHandler):
+    """
+    GET /metrics, Prometheus text format: instrumented serving calls and stages,
+    process memory, result cache and loaded artifacts
+    """
+    def get(self):
+        cache_stats = self.recommender.result_cache.stats()
+        store_stats = self.recommender.model_store.stats()
+        gauges = {f"result_cache_{name}": value for name, value in cache_stats.items() if name != "model_version"}
+        gauges.update({"model_loaded": int(store_stats["loaded"]),
+                       "model_version": store_stats.get("version"),
+                       "model_memory_bytes": store_stats.get("memory_bytes")})
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(METRICS.render_prometheus(gauges=gauges))
+
+
+class ThumbnailHandler(tornado.web.StaticFileHandler):
+    """
+    GET /thumbnails/<thumbnail>, poster thumbnails of the poster cache; they are
+    named after the sha256 of their content and never change, so clients may keep them
+    """
+    def get_cache_time(self, path, modified, mime_type):
+        return self.CACHE_MAX_AGE
+
+
+def make_app(recommender: BookRecommender, http_api_config) -> tornado.web.Application:
+    handler_args = {
+        "recommender": recommender,
+        "executor": ThreadPoolExecutor(max_workers=http_api_config.max_workers),
+        "http_api_config": http_api_config
+    }
+    return tornado.web.Application([
+        (r"/recommend", RecommendHandler, handler_args),
+        (r"/recommend/batch", BatchRecommendHandler, handler_args),
+        (r"/recommend/session", SessionRecommendHandler, handler_args),
+        (r"/recommend/user", UserRecommendHandler, handler_args),
+        (r"/search", SearchHandler, handler_args),
+        (r"/health", HealthHandler, handler_args),
+        (r"/metrics", MetricsHandler, handler_args),
+        (r"/thumbnails/(.*)", ThumbnailHandler, {"path": recommender.thumbnails_dir})
+    ])
+
+
+def main(argv=None):
+    try:
+        app_config = AppConfiguration()
+        http_api_config = app_config.get_http_api_config()
+        parser = argparse.ArgumentParser(description="Book recommendation HTTP API")
+        parser.add_argument("--address", default=http_api_config.address, help="address to listen on")
+        parser.add_argument("--port", type=int, default=http_api_config.port, help="port to listen on")
+        args = parser.parse_args(argv)
+
+        recommender = BookRecommender(app_config)
+        # load the artifacts once up front, they stay in memory for the life of the process
+        recommender.model_store.get()
+
+        app = make_app(recommender, http_api_config)
+        app.listen(args.port, address=args.address)
+        logger.info(f"HTTP API listening on {args.address}:{args.port}")
+        tornado.ioloop.IOLoop.current().start()
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
@@ -0,0 +1,242 @@
+import os
+import sys
+import time
+import pickle
+import threading
+import numpy as np
+from scipy.sparse import csr_matrix, load_npz
+from book_recommender.logging.log import logger
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.entity.artifact_entity import ServingArtifacts
+from book_recommender.utils.util import get_object_nbytes
+from book_recommender.utils.artifact_bundle import MANIFEST_FILE_NAME, load_serving_bundle, csr_from_bundle, touch_pages
+from book_recommender.utils.artifact_bundle import SortedTitleIndex, RowPosterIndex
+from book_recommender.utils.artifact_registry import ArtifactRegistry
+from book_recommender.utils.neighbour_index import load_index_from_bundle
+from book_recommender.utils.title_search import TitleSearchIndex, build_title_search_arrays, SEARCH_ARRAY_PREFIX
+from book_recommender.utils.instrumentation import instrument, record_counts
+
+class ModelStore:
+    """
+    ModelStore keeps one in-memory copy of the pretrained artifacts per process
+    and shares it between all callers (e.g. every Streamlit session).
+    With pretrained_format: mmap the arrays are memory mapped instead, so several
+    worker processes share the same pages through the OS page cache, and with
+    pretrained_format: registry the memory mapped bundle is the version the
+    artifact registry's CURRENT pointer names.
+    Artifacts are reloaded in a background thread when the files on disk change
+    (or the pointer is moved by a promotion or rollback) while the old snapshot
+    keeps serving, and the new snapshot replaces the old one in a single reference
+    swap so readers never see a half loaded state.
+    """
+    # artifacts the app can serve without, e.g. pretrained dirs older than the artifact
+    optional_artifacts = ("neighbours", "title_search", "thumbnails")
+
+    def __init__(self, pretrained_config, reload_check_interval: float = 2.0):
+        """
+        pretrained_config : PreTrainedConfig
+        reload_check_interval : minimum seconds between two mtime checks
+        """
+        self.pretrained_config = pretrained_config
+        self.reload_check_interval = reload_check_interval
+        self._lock = threading.Lock()
+        self._artifacts = None
+        self._signature = None
+        self._last_check = 0.0
+        self._reload_thread = None
+
+    def _bundle_dir(self) -> str:
+        if self.pretrained_config.pretrained_format == "registry":
+            bundle_dir = ArtifactRegistry(self.pretrained_config.pretrained_registry_dir).current_version_dir()
+            if bundle_dir is None:
+                raise FileNotFoundError(f"No promoted version in the artifact registry {self.pretrained_config.pretrained_registry_dir}")
+            return bundle_dir
+        return self.pretrained_config.pretrained_bundle_dir
+
+    def _artifact_paths(self) -> dict:
+        # written by the poster_cache stage, independent of the serving format
+        thumbnails = {"thumbnails": os.path.join(self.pretrained_config.pretrained_poster_cache, "thumbnails.npz")}
+        if self.pretrained_config.pretrained_format in ("mmap", "registry"):
+            # the manifest is written last, its mtime versions the whole bundle; arrays
+            # rewritten before it are caught by their dtype and shape in load_serving_bundle
+            paths = {"manifest": os.path.join(self._bundle_dir(), MANIFEST_FILE_NAME)}
+            if self.pretrained_config.pretrained_format == "registry":
+                # a rollback points to an older manifest, the pointer's mtime still moves forward
+                paths["pointer"] = ArtifactRegistry(self.pretrained_config.pretrained_registry_dir).pointer_path
+            return {**paths, **thumbnails}
+        return {
+            "model": self.pretrained_config.pretrained_model,
+            "book_matrix": self.pretrained_config.pretrained_book_pivot,
+            "book_names": self.pretrained_config.pretrained_book_names,
+            "title_index": self.pretrained_config.pretrained_title_index,
+            "poster_index": self.pretrained_config.pretrained_poster_index,
+            "neighbours": self.pretrained_config.pretrained_neighbours,
+            "title_search": self.pretrained_config.pretrained_title_search,
+            **thumbnails
+        }
+
+    def _file_signature(self, paths: dict = None) -> tuple:
+        signature = []
+        for name, path in (paths or self._artifact_paths()).items():
+            if name in self.optional_artifacts and not os.path.exists(path):
+                signature.append((path, 0, None))
+                continue
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    @staticmethod
+    def _load_file(name: str, path: str):
+        if name == "book_matrix":
+            # sparse pivot (book_pivot.npz) or dense pivot dataframe, served as csr either way
+            if path.endswith(".npz"):
+                return load_npz(path).tocsr()
+            with open(path, "rb") as f:
+                return csr_matrix(pickle.load(f).values)
+        if path.endswith(".npz"):
+            with np.load(path) as arrays:
+                arrays = {key: arrays[key] for key in arrays.files}
+            if name == "thumbnails":
+                return RowPosterIndex(SortedTitleIndex(arrays["titles"], arrays["title_order"]), arrays["thumbnails"])
+            return TitleSearchIndex(arrays) if name == "title_search" else arrays
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def _load_bundle(self, bundle_dir: str) -> dict:
+        arrays, manifest = load_serving_bundle(bundle_dir, mmap_mode="r")
+        # fault the pages in before the snapshot is published
+        touch_pages(arrays)
+        title_index = SortedTitleIndex(arrays["titles"], arrays["title_order"])
+        book_matrix = csr_from_bundle(arrays, "matrix", manifest["metadata"]["matrix_shape"])
+        return {
+            # no pickled estimator: approximate indexes are rebuilt from their arrays,
+            # with the brute backend fallback queries run on book_matrix directly
+            "model": load_index_from_bundle(arrays, manifest, book_matrix),
+            "book_matrix": book_matrix,
+            "book_names": arrays["titles"],
+            "title_index": title_index,
+            "poster_index": RowPosterIndex(title_index, arrays["posters"]),
+            "neighbours": {"indices": arrays["neighbour_indices"], "distances": arrays["neighbour_distances"]},
+            "title_search": TitleSearchIndex(arrays) if f"{SEARCH_ARRAY_PREFIX}tokens" in arrays else None,
+            # bundles older than the user index only serve title based recommendations
+            "users": arrays["users"] if "user_ratings_indptr" in arrays else None,
+            "user_ratings": csr_from_bundle(arrays, "user_ratings", (len(arrays["users"]), book_matrix.shape[0]))
+                            if "user_ratings_indptr" in arrays else None,
+            "user_top": {"rows": arrays["user_top_rows"], "scores": arrays["user_top_scores"]}
+                        if "user_top_rows" in arrays else None,
+            "bundle_version": manifest["metadata"].get("version")
+        }
+
+    @instrument("serving.load_artifacts", kind="load")
+    def load(self) -> ServingArtifacts:
+        """
+        Loads every artifact (unpickled or memory mapped, depending on pretrained_format)
+        and publishes them as the current snapshot
+        """
+        try:
+            with self._lock:
+                start = time.perf_counter()
+                paths = self._artifact_paths()
+                signature = self._file_signature(paths)
+                objects = self._load_bundle(os.path.dirname(paths["manifest"])) if "manifest" in paths else {}
+                bundle_version = objects.pop("bundle_version", None)
+                # the user index only exists in serving bundles
+                for name in ("users", "user_ratings", "user_top"):
+                    objects.setdefault(name, None)
+                for (name, path), (_, _, size) in zip(paths.items(), signature):
+                    if name not in ("manifest", "pointer"):
+                        objects[name] = self._load_file(name, path) if size is not None else None
+
+                if objects["title_search"] is None:
+                    # artifacts older than the search index, index the titles without popularity
+                    book_names = objects["book_names"]
+                    objects["title_search"] = TitleSearchIndex(build_title_search_arrays(book_names, np.zeros(len(book_names))))
+
+                # files replaced while we were reading them, keep the old snapshot
+                if self._file_signature() != signature:
+                    raise RuntimeError("Pretrained artifacts changed while loading, retry later")
+
+                memory_bytes = {name: get_object_nbytes(obj) for name, obj in objects.items() if obj is not None}
+                artifacts = ServingArtifacts(
+                    **objects,
+                    version = max(mtime for _, mtime, _ in signature),
+                    bundle_version = bundle_version,
+                    loaded_at = time.time(),
+                    load_time = time.perf_counter() - start,
+                    memory_bytes = memory_bytes
+                )
+                self._artifacts = artifacts
+                self._signature = signature
+                self._last_check = time.monotonic()
+
+            record_counts(titles=len(artifacts.book_names), memory_bytes=sum(memory_bytes.values()))
+            logger.info(f"Loaded pretrained artifacts {bundle_version or ''} in {artifacts.load_time:.3f}s, "
+                        f"memory footprint: {sum(memory_bytes.values())} bytes {memory_bytes}")
+            return artifacts
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def _is_stale(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_check < self.reload_check_interval:
+            return False
+        self._last_check = now
+        try:
+            return self._file_signature() != self._signature
+        except OSError as e:
+            # artifacts are being swapped on disk, keep serving the current snapshot
+            logger.warning(f"Could not stat pretrained artifacts: {e}")
+            return False
+
+    def _reload(self):
+        try:
+            self.load()
+        except AppException:
+            logger.warning("Reload of pretrained artifacts failed, serving previous version")
+
+    def get(self) -> ServingArtifacts:
+        """
+        Returns the current artifacts snapshot, loading it on first use; changed
+        artifacts are reloaded in the background and served once they are loaded
+        """
+        artifacts = self._artifacts
+        if artifacts is None:
+            return self.load()
+        if self._is_stale() and not (self._reload_thread and self._reload_thread.is_alive()):
+            self._reload_thread = threading.Thread(target=self._reload, name="model-store-reload", daemon=True)
+            self._reload_thread.start()
+        return artifacts
+
+    def stats(self) -> dict:
+        """
+        Returns load time and memory footprint of the current snapshot
+        """
+        artifacts = self._artifacts
+        if artifacts is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "version": artifacts.version,
+            "bundle_version": artifacts.bundle_version,
+            "loaded_at": artifacts.loaded_at,
+            "load_time": artifacts.load_time,
+            "memory_bytes": sum(artifacts.memory_bytes.values()),
+            "memory_bytes_per_artifact": dict(artifacts.memory_bytes)
+        }
+
+
+_model_stores = {}
+_model_stores_lock = threading.Lock()
+
+def get_model_store(pretrained_config) -> ModelStore:
+    """
+    Returns the process wide ModelStore for the given PreTrainedConfig
+    """
+    with _model_stores_lock:
+        store = _model_stores.get(pretrained_config)
+        if store is None:
+            store = ModelStore(pretrained_config)
+            _model_stores[pretrained_config] = store
+        return store
@@ -0,0 +1,293 @@
+import os
+import sys
+import numpy as np
+from book_recommender.logging.log import logger
+from book_recommender.config.configuration import AppConfiguration
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.serving.model_store import get_model_store
+from book_recommender.serving.result_cache import get_result_cache
+from book_recommender.utils.neighbours import gather_neighbours, cosine_kneighbors, aggregate_neighbour_scores, top_n_scores
+from book_recommender.utils.neighbour_index import ItemSimilarityIndex
+from book_recommender.utils.instrumentation import instrument, record_counts, configure_instrumentation
+
+class BookRecommender:
+    """
+    Recommendation logic shared by the Streamlit app and the command line tools
+    """
+    def __init__(self, app_config = None):
+        try:
+            app_config = app_config or AppConfiguration()
+            self.pretrained_config = app_config.get_pretrained_config()
+            # neighbours summed per title when there is no neighbour table to take the width from
+            self.session_neighbours = app_config.get_model_trainer_config().neighbours_top_k
+            self.book_names_dir = self.pretrained_config.pretrained_book_names
+            self.thumbnails_dir = os.path.join(self.pretrained_config.pretrained_poster_cache, "thumbnails")
+            self.model_store = get_model_store(self.pretrained_config)
+            self.result_cache = get_result_cache(app_config.get_result_cache_config())
+            configure_instrumentation(app_config.get_instrumentation_config())
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def get_neighbours(self, rows, n_neighbors: int, artifacts=None):
+        """
+        Nearest neighbours of many pivot rows at once: rows covered by the precomputed
+        neighbour table are a lookup, other rows are read from the item similarity
+        graph when the model is one, or go through one live search
+        returns (distances, indices) shaped (len(rows), n_neighbors)
+        """
+        try:
+            artifacts = artifacts or self.model_store.get()
+            rows = np.asarray(rows, dtype=np.int64)
+            distances, indices, covered = gather_neighbours(artifacts.neighbours, rows, n_neighbors)
+
+            if not covered.all():
+                missing = rows[~covered]
+                model = artifacts.model
+                if isinstance(model, ItemSimilarityIndex) and n_neighbors <= model.n_neighbors:
+                    # one row slice of the item similarity graph per title
+                    live_distances, live_indices = model.row_neighbours(missing, n_neighbors)
+                elif hasattr(model, "kneighbors"):
+                    live_distances, live_indices = model.kneighbors(artifacts.book_matrix[missing], n_neighbors=n_neighbors)
+                else:
+                    live_distances, live_indices = cosine_kneighbors(artifacts.book_matrix, artifacts.book_matrix[missing], n_neighbors=n_neighbors)
+                distances[~covered] = live_distances
+                indices[~covered] = live_indices
+
+            return distances, indices
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def get_thumbnail(self, title: str, artifacts) -> str:
+        """
+        Path of the cached thumbnail relative to thumbnails_dir, None without one
+        """
+        thumbnails = artifacts.thumbnails
+        if thumbnails is None or title not in thumbnails:
+            return None
+        return thumbnails[title] or None
+
+    def fetch_poster(self, suggestion, artifacts=None):
+        """
+        Local thumbnail of every suggested title, the poster url where the poster cache has none
+        """
+        try:
+            artifacts = artifacts or self.model_store.get()
+            poster_url = []
+
+            for book_id in suggestion[0]:
+                name = artifacts.book_names[book_id]
+                thumbnail = self.get_thumbnail(name, artifacts)
+                poster_url.append(os.path.join(self.thumbnails_dir, thumbnail) if thumbnail else artifacts.poster_index[name])
+
+            return poster_url
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("serving.search_titles", kind="serving", counts=lambda titles: {"results": len(titles)})
+    def search_titles(self, query: str, limit: int = 10) -> list:
+        """
+        Titles matching a partial or misspelled query, best match first
+        """
+        try:
+            artifacts = self.model_store.get()
+            return [str(artifacts.book_names[row]) for row in artifacts.title_search.search(query, limit)]
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("serving.recommend_book", kind="serving")
+    def recommend_book(self, book_name):
+        try:
+            books_list = []
+            artifacts = self.model_store.get()
+            self.result_cache.check_version(artifacts.version)
+            cache_key = ("recommend_book", book_name, 6, artifacts.version)
+            cached = self.result_cache.get(cache_key)
+            record_counts(cache_hit=int(cached is not None))
+            if cached is not None:
+                return cached
+            book_id = artifacts.title_index[book_name]
+
+            # serve from the precomputed neighbour table, the live model is only a fallback
+            distance, suggestion = self.get_neighbours([book_id], n_neighbors=6, artifacts=artifacts)
+
+            poster_url = self.fetch_poster(suggestion, artifacts)
+
+            for i in range(len(suggestion[0])):
+                books_list.append(str(artifacts.book_names[suggestion[0][i]]))
+
+            self.result_cache.put(cache_key, (books_list, poster_url))
+            return books_list, poster_url
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("serving.recommend_books", kind="serving")
+    def recommend_books(self, titles, k: int = 5) -> list:
+        """
+        Batch version of recommend_book: one neighbour search for all query titles
+        that are not in the result cache
+        titles: list of book titles
+        k: recommendations per title, the query title itself is excluded
+        returns one dict per title, in input order, with either
+        "recommendations" (title, distance, poster_url, thumbnail) or an "error"
+        """
+        try:
+            artifacts = self.model_store.get()
+            self.result_cache.check_version(artifacts.version)
+            results = [self.result_cache.get(("recommend_books", title, k, artifacts.version)) for title in titles]
+            missing = [i for i, result in enumerate(results) if result is None]
+            record_counts(titles=len(titles), k=k, computed=len(missing))
+            if missing:
+                computed = self.compute_recommendations([titles[i] for i in missing], k, artifacts)
+                for i, result in zip(missing, computed):
+                    results[i] = result
+                    # unknown titles are cheap to answer and would only crowd out real results
+                    if "recommendations" in result:
+                        self.result_cache.put(("recommend_books", titles[i], k, artifacts.version), result)
+            return results
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def compute_recommendations(self, titles, k: int, artifacts) -> list:
+        """
+        recommend_books without the result cache
+        """
+        try:
+            rows = [artifacts.title_index.get(title) for title in titles]
+            known = [i for i, row in enumerate(rows) if row is not None]
+
+            results = [{"title": title, "error": "unknown title"} for title in titles]
+            if not known:
+                return results
+
+            known_rows = np.array([rows[i] for i in known], dtype=np.int64)
+            n_neighbors = min(k + 1, artifacts.book_matrix.shape[0])
+            distances, indices = self.get_neighbours(known_rows, n_neighbors, artifacts)
+
+            for position, row, row_distances, row_indices in zip(known, known_rows, distances, indices):
+                keep = row_indices != row
+                recommendations = []
+                for distance, index in zip(row_distances[keep][:k], row_indices[keep][:k]):
+                    title = str(artifacts.book_names[index])
+                    recommendations.append({
+                        "title": title,
+                        "distance": float(distance),
+                        "poster_url": artifacts.poster_index[title],
+                        "thumbnail": self.get_thumbnail(title, artifacts)
+                    })
+                results[position] = {"title": titles[position], "recommendations": recommendations}
+
+            return results
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def score_titles(self, rows, weights, k: int, artifacts):
+        """
+        Sums the weighted similarities of the neighbours of the given title rows into
+        one score per title and returns the k best (rows, scores), the given rows excluded.
+        The neighbourhood does not depend on k (the width of the neighbour table, like the
+        precomputed user top-N), so a larger k only extends the ranking of a smaller one
+        """
+        n_rows = artifacts.book_matrix.shape[0]
+        table_width = artifacts.neighbours["indices"].shape[1] if artifacts.neighbours is not None else self.session_neighbours
+        n_neighbors = min(table_width, n_rows)
+        distances, indices = self.get_neighbours(rows, n_neighbors, artifacts)
+        candidates, scores = aggregate_neighbour_scores(indices, distances, weights, n_rows, exclude_rows=rows)
+        # ranked in float32 like the precomputed user top-N, so both paths break near ties the same way
+        return top_n_scores(candidates, scores.astype(np.float32), k)
+
+    def format_scored_titles(self, rows, scores, artifacts) -> list:
+        recommendations = []
+        for row, score in zip(rows, scores):
+            title = str(artifacts.book_names[row])
+            recommendations.append({
+                "title": title,
+                "score": float(score),
+                "poster_url": artifacts.poster_index[title],
+                "thumbnail": self.get_thumbnail(title, artifacts)
+            })
+        return recommendations
+
+    @instrument("serving.recommend_session", kind="serving",
+                counts=lambda result: {"session_titles": len(result["titles"]), "recommendations": len(result["recommendations"])})
+    def recommend_session(self, titles, ratings=None, k: int = 10) -> dict:
+        """
+        Recommendations for a list of liked titles (e.g. a user's shelf): the neighbour
+        lists of all titles are read in one lookup and their similarities, weighted
+        by the ratings, are summed into one score per title. Titles of the session are
+        never recommended.
+        titles: list of book titles
+        ratings: optional list of positive ratings aligned with titles, used as weights (default 1 each)
+        k: number of recommendations
+        returns {"titles", "unknown_titles", "recommendations": [{title, score, poster_url, thumbnail}]}
+        """
+        try:
+            if ratings is not None and len(ratings) != len(titles):
+                raise ValueError(f"{len(ratings)} ratings for {len(titles)} titles")
+            if ratings is not None and not all(np.isfinite(rating) and rating > 0 for rating in ratings):
+                raise ValueError("ratings must be positive finite numbers")
+            artifacts = self.model_store.get()
+            rows = [artifacts.title_index.get(title) for title in titles]
+            weights = [1.0] * len(titles) if ratings is None else [float(rating) for rating in ratings]
+            known = [(row, weight) for row, weight in zip(rows, weights) if row is not None]
+            result = {"titles": list(titles), "unknown_titles": [title for title, row in zip(titles, rows) if row is None],
+                      "recommendations": []}
+            if not known:
+                return result
+
+            session_rows = np.array([row for row, _ in known], dtype=np.int64)
+            rows, scores = self.score_titles(session_rows, [weight for _, weight in known], k, artifacts)
+            result["recommendations"] = self.format_scored_titles(rows, scores, artifacts)
+            return result
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    @instrument("serving.recommend_for_user", kind="serving",
+                counts=lambda result: {"recommendations": len(result.get("recommendations", []))})
+    def recommend_for_user(self, user_id: int, k: int = 10) -> dict:
+        """
+        Personalized recommendations for a user of the rating matrix, read from the
+        top-N table precomputed in training when it holds k titles per user. Otherwise
+        the user's rated titles (one slice of the per user index) are scored like a
+        session weighted by the user's ratings. Rated titles are never recommended.
+        returns {"user_id", "recommendations": [{title, score, poster_url, thumbnail}]}
+        or {"user_id", "error": "unknown user"}
+        """
+        try:
+            artifacts = self.model_store.get()
+            if artifacts.user_ratings is None:
+                raise ValueError("The loaded artifacts have no user index, serve a bundle with pretrained_format: mmap or registry")
+            user = int(np.searchsorted(artifacts.users, user_id))
+            if user >= len(artifacts.users) or artifacts.users[user] != user_id:
+                return {"user_id": user_id, "error": "unknown user"}
+
+            if artifacts.user_top is not None and k <= artifacts.user_top["rows"].shape[1]:
+                rows, scores = artifacts.user_top["rows"][user, :k], artifacts.user_top["scores"][user, :k]
+                rows, scores = rows[rows >= 0], scores[rows >= 0]
+                record_counts(precomputed=1)
+            else:
+                # same neighbourhood and ranking as the precomputed table, larger k only extends it
+                start, stop = artifacts.user_ratings.indptr[user], artifacts.user_ratings.indptr[user + 1]
+                rated = artifacts.user_ratings.indices[start:stop].astype(np.int64)
+                rows, scores = self.score_titles(rated, artifacts.user_ratings.data[start:stop], k, artifacts)
+                record_counts(precomputed=0, rated_titles=len(rated))
+
+            return {"user_id": user_id, "recommendations": self.format_scored_titles(rows, scores, artifacts)}
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
@@ -0,0 +1,55 @@
+import sys
+import json
+import argparse
+from book_recommender.logging.log import logger
+from book_recommender.config.configuration import AppConfiguration
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.utils.artifact_registry import ArtifactRegistry
+
+def list_versions(registry: ArtifactRegistry) -> list:
+    """
+    One entry per version, oldest first, with its source, creation time and whether it is served
+    """
+    pointer = registry.read_pointer() or {"version": None, "history": []}
+    versions = []
+    for version in registry.list_versions():
+        manifest = registry.read_manifest(version)
+        versions.append({
+            "version": version,
+            "current": version == pointer["version"],
+            "in_rollback_history": version in pointer["history"],
+            "source": manifest["metadata"].get("source"),
+            "created_at": manifest["created_at"],
+            "matrix_shape": manifest["metadata"].get("matrix_shape")
+        })
+    return versions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the versions of the artifact registry")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the versions, oldest first")
+    promote = commands.add_parser("promote", help="serve a version (running servers swap to it without a restart)")
+    promote.add_argument("version")
+    commands.add_parser("rollback", help="serve the previously promoted version again")
+    verify = commands.add_parser("verify", help="check the files of a version against their sha256")
+    verify.add_argument("version")
+    args = parser.parse_args(argv)
+
+    try:
+        artifact_registry_config = AppConfiguration().get_artifact_registry_config()
+        registry = ArtifactRegistry(artifact_registry_config.registry_dir, artifact_registry_config.keep_versions)
+        if args.command == "list":
+            result = list_versions(registry)
+        elif args.command == "promote":
+            result = {"current": registry.promote(args.version)}
+        elif args.command == "rollback":
+            result = {"current": registry.rollback()}
+        else:
+            registry.verify(args.version)
+            result = {"version": args.version, "verified": True}
+        print(json.dumps(result, indent=2))
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
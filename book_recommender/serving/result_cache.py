@@ -0,0 +1,121 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+
+class ResultCache:
+    """
+    Thread safe LRU cache of recommendation results with a time to live,
+    bounded by entry count and by the approximate size of the cached results.
+    Keys carry the model version and the whole cache is dropped as soon as
+    a different model version is seen, so results of an old model are never served.
+    Cached values are shared between callers and must not be modified.
+    """
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 ** 2, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def estimate_nbytes(value) -> int:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+    def _clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def check_version(self, version):
+        """
+        Drops every entry when the model version changed since the last call
+        """
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self._counters["invalidations"] += 1
+                self._clear()
+                self._version = version
+
+    def get(self, key):
+        """
+        returns the cached value or None
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            value, nbytes, expires_at = entry
+            if self.ttl_seconds and time.monotonic() > expires_at:
+                del self._entries[key]
+                self._bytes -= nbytes
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        nbytes = self.estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, nbytes, time.monotonic() + (self.ttl_seconds or 0))
+            self._bytes += nbytes
+            # least recently used entries go first
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_bytes, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self._counters["evictions"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "model_version": self._version
+            }
+
+
+_result_caches = {}
+_result_caches_lock = threading.Lock()
+
+def get_result_cache(result_cache_config) -> ResultCache:
+    """
+    Returns the process wide ResultCache for the given ResultCacheConfig,
+    shared by every recommender of the process (Streamlit creates one per rerun)
+    """
+    with _result_caches_lock:
+        cache = _result_caches.get(result_cache_config)
+        if cache is None:
+            cache = ResultCache(result_cache_config.max_entries, result_cache_config.max_bytes,
+                                result_cache_config.ttl_seconds)
+            _result_caches[result_cache_config] = cache
+        return cache
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+from scipy.sparse import csr_matrix
+from book_recommender.logging.log import logger
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.utils.util import file_sha256
+
+MANIFEST_FILE_NAME = "manifest.json"
+BUNDLE_FORMAT_VERSION = 1
+
+def save_serving_bundle(bundle_dir: str, arrays: dict, metadata: dict = None, files: dict = None) -> str:
+    """
+    Writes a pickle free serving bundle: one .npy file per array plus manifest.json
+    Every file is written to a temporary name and swapped in with os.replace so
+    processes that still have the previous files memory mapped keep reading them.
+    The manifest is written last and marks the bundle as complete, it records
+    dtype, shape and sha256 of every file.
+    bundle_dir: str
+    arrays: dict of name -> numpy array
+    metadata: extra json serializable information stored in the manifest
+    files: dict of name -> file name of other files already written into bundle_dir (e.g. model.pkl)
+    returns the manifest path
+    """
+    try:
+        os.makedirs(bundle_dir, exist_ok=True)
+        array_files = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            if array.dtype == object:
+                raise ValueError(f"Array {name} has object dtype and cannot be memory mapped")
+            file_name = f"{name}.npy"
+            tmp_path = os.path.join(bundle_dir, f".{file_name}.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, array, allow_pickle=False)
+            os.replace(tmp_path, os.path.join(bundle_dir, file_name))
+            array_files[name] = {"file": file_name, "dtype": array.dtype.str, "shape": list(array.shape),
+                                 "sha256": file_sha256(os.path.join(bundle_dir, file_name))}
+
+        manifest = {
+            "format_version": BUNDLE_FORMAT_VERSION,
+            "created_at": time.time(),
+            "arrays": array_files,
+            "files": {name: {"file": file_name, "sha256": file_sha256(os.path.join(bundle_dir, file_name))}
+                      for name, file_name in (files or {}).items()},
+            "metadata": metadata or {}
+        }
+        manifest_path = os.path.join(bundle_dir, MANIFEST_FILE_NAME)
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+        logger.info(f"Saved serving bundle with arrays {sorted(array_files)} to : {bundle_dir}")
+        return manifest_path
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
+
+
+def load_serving_bundle(bundle_dir: str, mmap_mode: str = "r"):
+    """
+    Opens every array of a serving bundle, memory mapped by default so that
+    worker processes share the pages through the OS page cache.
+    Every array must have the dtype and shape of the manifest: while a bundle is
+    rewritten in place the old manifest sits next to new arrays, such a mix raises
+    returns (arrays dict, manifest dict)
+    """
+    try:
+        with open(os.path.join(bundle_dir, MANIFEST_FILE_NAME), "r") as f:
+            manifest = json.load(f)
+        if manifest["format_version"] != BUNDLE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported serving bundle format version: {manifest['format_version']}")
+
+        arrays = {}
+        for name, info in manifest["arrays"].items():
+            arrays[name] = np.load(os.path.join(bundle_dir, info["file"]), mmap_mode=mmap_mode, allow_pickle=False)
+            if arrays[name].dtype.str != info["dtype"] or list(arrays[name].shape) != info["shape"]:
+                raise ValueError(f"{info['file']} ({arrays[name].dtype.str}, {list(arrays[name].shape)}) does not match "
+                                 f"the manifest ({info['dtype']}, {info['shape']}), the bundle is being rewritten")
+        return arrays, manifest
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
+
+
+def touch_pages(arrays: dict, page_size: int = 4096) -> int:
+    """
+    Reads one byte of every page of the memory mapped arrays, so the first
+    requests served from a freshly loaded bundle do not wait for the disk
+    returns the bytes touched
+    """
+    touched = 0
+    for array in arrays.values():
+        if isinstance(array, np.memmap) and array.size:
+            array.reshape(-1).view(np.uint8)[::page_size].max()
+            touched += array.nbytes
+    return touched
+
+
+def csr_from_bundle(arrays: dict, prefix: str, shape) -> csr_matrix:
+    """
+    Rebuilds a csr matrix on top of the (memory mapped) data/indices/indptr arrays
+    """
+    return csr_matrix((arrays[f"{prefix}_data"], arrays[f"{prefix}_indices"], arrays[f"{prefix}_indptr"]),
+                      shape=tuple(shape), copy=False)
+
+
+def csr_to_bundle_arrays(matrix, prefix: str) -> dict:
+    """
+    Splits a csr matrix into the arrays stored in a serving bundle
+    """
+    matrix = csr_matrix(matrix)
+    # one index dtype for both arrays, otherwise scipy copies them on load
+    index_dtype = np.int32 if matrix.nnz < np.iinfo(np.int32).max else np.int64
+    return {
+        f"{prefix}_data": matrix.data,
+        f"{prefix}_indices": matrix.indices.astype(index_dtype),
+        f"{prefix}_indptr": matrix.indptr.astype(index_dtype)
+    }
+
+
+class SortedTitleIndex:
+    """
+    Read only title -> row id mapping over a (memory mapped) titles array,
+    lookups are a binary search through the precomputed sort order
+    """
+    def __init__(self, titles: np.ndarray, order: np.ndarray):
+        self.titles = titles
+        self.order = order
+
+    def get(self, title, default=None):
+        position = np.searchsorted(self.titles, title, sorter=self.order)
+        if position < len(self.order):
+            row = int(self.order[position])
+            if self.titles[row] == title:
+                return row
+        return default
+
+    def __getitem__(self, title) -> int:
+        row = self.get(title)
+        if row is None:
+            raise KeyError(title)
+        return row
+
+    def __contains__(self, title) -> bool:
+        return self.get(title) is not None
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.titles.nbytes + self.order.nbytes)
+
+
+class RowPosterIndex:
+    """
+    Read only title -> poster url mapping over a posters array aligned with the title rows
+    """
+    def __init__(self, title_index: SortedTitleIndex, posters: np.ndarray):
+        self.title_index = title_index
+        self.posters = posters
+
+    def __getitem__(self, title) -> str:
+        return str(self.posters[self.title_index[title]])
+
+    def __contains__(self, title) -> bool:
+        return title in self.title_index
+
+    def __len__(self) -> int:
+        return len(self.posters)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.posters.nbytes)
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+from datetime import datetime
+from book_recommender.logging.log import logger
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.utils.util import file_sha256
+from book_recommender.utils.artifact_bundle import MANIFEST_FILE_NAME, save_serving_bundle
+
+CURRENT_VERSION_FILE = "CURRENT"
+
+class ArtifactRegistry:
+    """
+    Local registry of serving bundles. Every training or incremental run is
+    published as an immutable version directory (bundle arrays, model.pkl and
+    a manifest with dtype, shape and sha256 of each file) under versions/.
+    The CURRENT pointer names the served version and is swapped atomically,
+    it keeps the previously promoted versions for rollbacks.
+
+    registry_dir/
+        versions/<version>/manifest.json, *.npy, model.pkl
+        CURRENT  {"version": ..., "promoted_at": ..., "history": [older versions, newest last]}
+    """
+    def __init__(self, registry_dir: str, keep_versions: int = 10):
+        """
+        keep_versions : versions kept on disk, the current one and the rollback history are never removed
+        """
+        self.registry_dir = registry_dir
+        self.keep_versions = keep_versions
+        self.versions_dir = os.path.join(registry_dir, "versions")
+        self.pointer_path = os.path.join(registry_dir, CURRENT_VERSION_FILE)
+
+    def version_dir(self, version: str) -> str:
+        return os.path.join(self.versions_dir, version)
+
+    def list_versions(self) -> list:
+        """
+        Complete versions, oldest first (version names sort by creation time)
+        """
+        if not os.path.isdir(self.versions_dir):
+            return []
+        return sorted(name for name in os.listdir(self.versions_dir)
+                      if not name.startswith(".") and os.path.exists(os.path.join(self.versions_dir, name, MANIFEST_FILE_NAME)))
+
+    def read_manifest(self, version: str) -> dict:
+        with open(os.path.join(self.version_dir(version), MANIFEST_FILE_NAME), "r") as f:
+            return json.load(f)
+
+    def read_pointer(self) -> dict:
+        """
+        returns the CURRENT pointer, None before the first promotion
+        """
+        if not os.path.exists(self.pointer_path):
+            return None
+        with open(self.pointer_path, "r") as f:
+            return json.load(f)
+
+    def current_version(self) -> str:
+        pointer = self.read_pointer()
+        return pointer["version"] if pointer else None
+
+    def current_version_dir(self) -> str:
+        """
+        Directory of the served version, None before the first promotion
+        """
+        version = self.current_version()
+        return self.version_dir(version) if version else None
+
+    def publish(self, arrays: dict, metadata: dict, model=None) -> str:
+        """
+        Writes a new version into a temporary directory and renames it into versions/,
+        its files are made read only. The version is not served until it is promoted.
+        returns the version name
+        """
+        try:
+            os.makedirs(self.versions_dir, exist_ok=True)
+            version = datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f")
+            tmp_dir = os.path.join(self.versions_dir, f".{version}.tmp")
+            os.makedirs(tmp_dir)
+            files = {}
+            if model is not None:
+                with open(os.path.join(tmp_dir, "model.pkl"), "wb") as f:
+                    pickle.dump(model, f)
+                files["model"] = "model.pkl"
+            save_serving_bundle(tmp_dir, arrays, metadata={**metadata, "version": version}, files=files)
+            for file_name in os.listdir(tmp_dir):
+                os.chmod(os.path.join(tmp_dir, file_name), 0o444)
+
+            os.rename(tmp_dir, self.version_dir(version))
+            logger.info(f"Published version {version} to : {self.version_dir(version)}")
+            return version
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def verify(self, version: str) -> dict:
+        """
+        Checks every file of a version against the sha256 in its manifest
+        returns the manifest, raises ValueError for missing or modified files
+        """
+        try:
+            manifest = self.read_manifest(version)
+            for name, info in {**manifest["arrays"], **manifest.get("files", {})}.items():
+                path = os.path.join(self.version_dir(version), info["file"])
+                if "sha256" not in info:
+                    raise ValueError(f"Version {version} has no checksum for {name}")
+                if not os.path.exists(path) or file_sha256(path) != info["sha256"]:
+                    raise ValueError(f"Version {version} is corrupt: {info['file']} is missing or was modified")
+            return manifest
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def _write_pointer(self, version: str, history: list):
+        pointer = {"version": version, "promoted_at": time.time(), "history": history[-self.keep_versions:]}
+        tmp_path = os.path.join(self.registry_dir, f".{CURRENT_VERSION_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(pointer, f, indent=2)
+        # the one atomic step: servers see either the old or the new pointer
+        os.replace(tmp_path, self.pointer_path)
+
+    def promote(self, version: str) -> str:
+        """
+        Verifies a version and makes it the served one, the previous version goes onto the rollback history
+        """
+        try:
+            self.verify(version)
+            pointer = self.read_pointer()
+            history = pointer["history"] if pointer else []
+            if pointer and pointer["version"] != version:
+                history = history + [pointer["version"]]
+            self._write_pointer(version, history)
+            logger.info(f"Promoted version {version}" + (f", previous version {pointer['version']}" if pointer else ""))
+            self.prune()
+            return version
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def rollback(self) -> str:
+        """
+        Serves the version promoted before the current one again
+        returns the restored version
+        """
+        try:
+            pointer = self.read_pointer()
+            if not pointer or not pointer["history"]:
+                raise ValueError("No previous version to roll back to")
+            version = pointer["history"][-1]
+            self.verify(version)
+            self._write_pointer(version, pointer["history"][:-1])
+            logger.info(f"Rolled back from version {pointer['version']} to {version}")
+            return version
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def prune(self) -> list:
+        """
+        Removes the oldest versions beyond keep_versions that are neither served
+        nor part of the rollback history, processes still mapping them keep their pages
+        returns the removed versions
+        """
+        try:
+            pointer = self.read_pointer() or {"version": None, "history": []}
+            protected = {pointer["version"], *pointer["history"]}
+            versions = self.list_versions()
+            removable = [version for version in versions[:max(0, len(versions) - self.keep_versions)] if version not in protected]
+            for version in removable:
+                shutil.rmtree(self.version_dir(version))
+            if removable:
+                logger.info(f"Removed old versions {removable}")
+            return removable
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
@@ -0,0 +1,102 @@
+import sys
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from book_recommender.logging.log import logger
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.utils.dtype_policy import cast_ratings
+
+TEXT_COLUMNS = ["isbn", "title", "author", "year", "publisher", "image_url"]
+ID_COLUMNS = ["user_id", "total_ratings"]
+
+def compact_dtypes(df, dtype_config):
+    """
+    Applies the dtype policy to the clean data: text columns as categoricals (or strings),
+    ids and counts as index_dtype and ratings as rating_dtype.
+    Text values are made strings first (year mixes numbers and text)
+    dtype_config : DtypeConfig
+    """
+    try:
+        df = df.copy()
+        for column in TEXT_COLUMNS:
+            if column in df:
+                df[column] = df[column].map(str, na_action="ignore")
+                if dtype_config.text_dtype == "category":
+                    df[column] = df[column].astype("category")
+        for column in ID_COLUMNS:
+            if column in df:
+                df[column] = df[column].astype(dtype_config.index_dtype)
+        if "rating" in df:
+            # the streaming spool hands over ratings as text
+            df["rating"] = cast_ratings(pd.to_numeric(df["rating"]).to_numpy(), dtype_config.rating_dtype)
+        return df
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
+
+
+class CleanDataWriter:
+    """
+    Writes the clean data in one or more chunks as parquet (dtypes of the dtype policy,
+    one row group per chunk) or csv, the format comes from the file extension
+    """
+    def __init__(self, path: str, dtype_config):
+        """
+        dtype_config : DtypeConfig
+        """
+        self.path = path
+        self.dtype_config = dtype_config
+        self.file_format = path.rsplit(".", 1)[-1]
+        self.schema = None
+        self._writer = None
+        self._file = None
+
+    def write(self, df):
+        try:
+            if self.file_format == "csv":
+                header = self._file is None
+                if self._file is None:
+                    self._file = open(self.path, "w", newline="", encoding="utf-8")
+                df.to_csv(self._file, header=header, index=False)
+                return
+
+            df = compact_dtypes(df, self.dtype_config)
+            if self._writer is None:
+                schema = pa.Schema.from_pandas(df, preserve_index=False)
+                # fixed int32 dictionary indices, pandas picks int8/int16/int32 per chunk
+                self.schema = pa.schema([field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+                                         if pa.types.is_dictionary(field.type) else field for field in schema],
+                                        metadata=schema.metadata)
+                self._writer = pq.ParquetWriter(self.path, self.schema)
+            self._writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_clean_data(path: str, columns: list = None):
+    """
+    Reads only the given columns of clean_data.parquet / clean_data.csv
+    """
+    try:
+        if path.endswith(".parquet"):
+            return pd.read_parquet(path, columns=columns)
+        return pd.read_csv(path, usecols=columns)
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
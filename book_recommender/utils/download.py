@@ -0,0 +1,104 @@
+import os
+import time
+import zlib
+import http.client
+import urllib.error
+import urllib.request
+from book_recommender.logging.log import logger
+from book_recommender.utils.util import file_sha256
+
+# answers worth resuming after, anything else (404, 403 ...) will not get better
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+def file_crc32(path: str, block_size: int = 1 << 20) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+def partial_download_path(path: str) -> str:
+    """
+    Hidden file the download is streamed into, it keeps the bytes of an interrupted download
+    """
+    return os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.part")
+
+
+def _stream_into(url: str, part_path: str, chunk_size: int, timeout: float, progress_step: int) -> bool:
+    """
+    One request for the bytes missing from part_path, resumed with a Range header
+    returns True once the file is complete
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset:
+            # nothing left to send, the previous attempt got every byte
+            return True
+        raise
+
+    with response:
+        if offset and response.status != 206:
+            # server ignores ranges, start over
+            logger.info(f"{url} does not support range requests, restarting the download")
+            offset = 0
+        elif offset:
+            logger.info(f"Resuming download of {url} at byte {offset}")
+        length = response.headers.get("Content-Length")
+        total = offset + int(length) if length is not None else None
+
+        written = offset
+        next_report = written + progress_step
+        with open(part_path, "ab" if offset else "wb") as f:
+            for chunk in iter(lambda: response.read(chunk_size), b""):
+                f.write(chunk)
+                written += len(chunk)
+                if written >= next_report:
+                    share = f" ({written / total:.0%})" if total else ""
+                    logger.info(f"Downloaded {written / 2**20:.1f} MB{share} of {url}")
+                    next_report = written + progress_step
+
+    # a dropped connection can end the body early without an error
+    return total is None or written >= total
+
+
+def download_file(url: str, path: str, chunk_size: int, max_retries: int, timeout: float,
+                  backoff_seconds: float = 1.0, expected_sha256: str = None) -> str:
+    """
+    Streams url into path in chunks. Interrupted downloads continue from the bytes
+    already on disk (HTTP Range) on the next attempt or the next run, and the file
+    only appears at path once it is complete and matches expected_sha256 (if given).
+    returns path
+    """
+    part_path = partial_download_path(path)
+    progress_step = max(chunk_size, 10 * 2**20)
+    for attempt in range(max_retries + 1):
+        if attempt:
+            time.sleep(backoff_seconds * 2 ** (attempt - 1))
+        try:
+            if _stream_into(url, part_path, chunk_size, timeout, progress_step):
+                break
+            logger.warning(f"Download of {url} ended early, attempt {attempt + 1} of {max_retries + 1}")
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_STATUSES or attempt == max_retries:
+                raise
+            logger.warning(f"Download of {url} failed with HTTP {e.code}, attempt {attempt + 1} of {max_retries + 1}")
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+            if attempt == max_retries:
+                raise
+            logger.warning(f"Download of {url} failed: {e}, attempt {attempt + 1} of {max_retries + 1}")
+    else:
+        raise IOError(f"Download of {url} incomplete after {max_retries + 1} attempts")
+
+    if expected_sha256:
+        sha256 = file_sha256(part_path)
+        if sha256 != expected_sha256.lower():
+            # a corrupt partial file would poison every resume, drop it
+            os.remove(part_path)
+            raise ValueError(f"Checksum mismatch for {url}: expected sha256 {expected_sha256}, got {sha256}")
+    os.replace(part_path, path)
+    return path
@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import numpy as np
+from book_recommender.logging.log import logger
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.utils.util import get_object_nbytes, get_wide_nbytes
+from book_recommender.utils.instrumentation import record_counts
+
+RATING_DTYPES = ("uint8", "float32", "float64")
+INDEX_DTYPES = ("int32", "int64")
+TEXT_DTYPES = ("category", "object")
+
+
+def check_dtype_config(dtype_config):
+    """
+    dtype_config : DtypeConfig
+    """
+    for name, value, allowed in (("rating_dtype", dtype_config.rating_dtype, RATING_DTYPES),
+                                 ("index_dtype", dtype_config.index_dtype, INDEX_DTYPES),
+                                 ("text_dtype", dtype_config.text_dtype, TEXT_DTYPES)):
+        if value not in allowed:
+            raise ValueError(f"Unsupported {name} {value}, expected one of {allowed}")
+
+
+def cast_ratings(values, rating_dtype: str) -> np.ndarray:
+    """
+    Ratings as rating_dtype, integer dtypes refuse values they cannot hold exactly
+    """
+    try:
+        values = np.asarray(values)
+        dtype = np.dtype(rating_dtype)
+        if dtype.kind in "iu" and values.size:
+            info = np.iinfo(dtype)
+            if values.min() < info.min or values.max() > info.max or \
+                    (values.dtype.kind == "f" and not np.array_equal(values, np.round(values))):
+                raise ValueError(f"Ratings between {values.min()} and {values.max()} do not fit into {rating_dtype}, "
+                                 f"use rating_dtype: float32")
+        return values.astype(dtype, copy=False)
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
+
+
+def estimator_dtype(rating_dtype: str) -> np.dtype:
+    """
+    dtype of the rating matrix handed to estimators, which expect floats
+    """
+    dtype = np.dtype(rating_dtype)
+    return np.dtype(np.float32) if dtype.kind in "iu" else dtype
+
+
+def _dtype_names(obj) -> list:
+    if hasattr(obj, "dtypes"):
+        return sorted({str(dtype) for dtype in obj.dtypes})
+    for attr in ("_fit_X", "matrix"):
+        if getattr(obj, attr, None) is not None:
+            return _dtype_names(getattr(obj, attr))
+    return [str(obj.dtype)] if hasattr(obj, "dtype") else []
+
+
+def save_dtype_report(report_path: str, artifacts: dict, dtype_config) -> dict:
+    """
+    Writes the in-memory size of each artifact next to its size with 8 byte
+    numbers and string objects (the dtypes before the policy) as JSON
+    artifacts: {artifact name: DataFrame, array, sparse matrix or estimator}
+    returns the report
+    """
+    try:
+        report = {"dtype_config": dtype_config._asdict(), "artifacts": {}}
+        for name, obj in artifacts.items():
+            nbytes, wide_nbytes = get_object_nbytes(obj), get_wide_nbytes(obj)
+            report["artifacts"][name] = {"dtypes": _dtype_names(obj), "bytes": nbytes,
+                                         "baseline_bytes": wide_nbytes, "saved_bytes": wide_nbytes - nbytes}
+        entries = report["artifacts"].values()
+        report["bytes"] = sum(entry["bytes"] for entry in entries)
+        report["baseline_bytes"] = sum(entry["baseline_bytes"] for entry in entries)
+        report["saved_bytes"] = report["baseline_bytes"] - report["bytes"]
+
+        os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        record_counts(artifact_bytes=report["bytes"], saved_bytes=report["saved_bytes"])
+        logger.info(f"Saved dtype report to : {report_path}, "
+                    f"{report['bytes']} bytes instead of {report['baseline_bytes']} ({report['saved_bytes']} saved)")
+        return report
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import math
+import bisect
+import time
+import random
+import logging
+import functools
+import threading
+import contextvars
+from datetime import datetime, timezone
+from book_recommender.logging.log import get_logger
+
+# JSON metric records go to their own logger, book_recommender/logging/log.py writes them to logs/metrics_*.jsonl
+metrics_logger = logging.getLogger("book_recommender.metrics")
+
+# wall time histogram buckets in seconds, from single serving calls to full training stages
+WALL_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                     1, 2.5, 5, 10, 30, 60, 120, 300, 600, math.inf)
+
+_settings = {"metrics_log": True, "serving_log_sample_rate": 1.0}
+_current = contextvars.ContextVar("current_instrument", default=None)
+
+
+def configure_instrumentation(instrumentation_config):
+    """
+    instrumentation_config : InstrumentationConfig
+    """
+    _settings["metrics_log"] = instrumentation_config.metrics_log
+    _settings["serving_log_sample_rate"] = instrumentation_config.serving_log_sample_rate
+
+
+def get_rss_bytes() -> int:
+    """
+    Current resident set size of the process
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, AttributeError, ValueError):
+        import psutil
+        return psutil.Process().memory_info().rss
+
+
+def get_peak_rss_bytes():
+    """
+    Highest resident set size of the process so far, None where getrusage is missing
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS; the kernel updates it lazily, it can trail the current RSS
+    return max(peak if sys.platform == "darwin" else peak * 1024, get_rss_bytes())
+
+
+def record_counts(**counts):
+    """
+    Adds row / shape counts to the innermost running instrument, no-op outside of one
+        record_counts(rows=len(df), matrix_shape=book_sparse.shape)
+    """
+    current = _current.get()
+    if current is not None:
+        current.counts.update(counts)
+
+
+def _plain(value):
+    """
+    JSON friendly count: numpy scalars as python numbers, shapes as lists
+    """
+    if isinstance(value, (tuple, list)):
+        return [_plain(item) for item in value]
+    return value.item() if hasattr(value, "item") else value
+
+
+class Instrument:
+    """
+    Measures a block or a function: wall time, CPU time, memory and the counts
+    passed to record_counts. Each finished block is added to METRICS (Prometheus
+    text) and written as one JSON record to the metrics log.
+    kind "serving": thread CPU time only, cheap enough for every call; a share of
+    the calls (serving_log_sample_rate) is written to the metrics log, all are counted
+    other kinds ("stage", "load"): process CPU time, RSS before / after and the process peak RSS
+    """
+    def __init__(self, name: str, kind: str = "stage", counts=None):
+        """
+        counts: function of the return value giving counts (decorator only)
+        """
+        self.name = name
+        self.kind = kind
+        self.counts_function = counts
+        self.counts = {}
+
+    def __enter__(self):
+        self.counts = {}
+        self._parent = _current.get()
+        self._token = _current.set(self)
+        self._cpu_clock = time.thread_time if self.kind == "serving" else time.process_time
+        if self.kind != "serving":
+            self._rss_start = get_rss_bytes()
+        self._cpu_start = self._cpu_clock()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.perf_counter() - self._start
+        cpu_time = self._cpu_clock() - self._cpu_start
+        _current.reset(self._token)
+
+        memory = {}
+        if self.kind != "serving":
+            rss = get_rss_bytes()
+            memory = {"rss_bytes": rss, "rss_delta_bytes": rss - self._rss_start, "peak_rss_bytes": get_peak_rss_bytes()}
+        METRICS.observe(self.name, self.kind, exc_type is not None, wall_time, cpu_time, self.counts, memory.get("peak_rss_bytes"))
+
+        # the JSON record is only built when it is written, serving calls are sampled
+        if _settings["metrics_log"] and (self.kind != "serving" or random.random() < _settings["serving_log_sample_rate"]):
+            record = {
+                "event": "metric",
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "pid": os.getpid(),
+                "name": self.name,
+                "kind": self.kind,
+                "parent": self._parent.name if self._parent is not None else None,
+                "status": "ok" if exc_type is None else "error",
+                "wall_time_s": wall_time,
+                "cpu_time_s": cpu_time,
+                "counts": {name: _plain(value) for name, value in self.counts.items()},
+                **memory
+            }
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            # the metrics log file is set up together with the main log
+            get_logger()
+            metrics_logger.info(json.dumps(record, default=str))
+        return False
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            # a fresh instrument per call, the decorated function may run in several threads at once
+            with Instrument(self.name, self.kind):
+                result = function(*args, **kwargs)
+                if self.counts_function is not None:
+                    record_counts(**self.counts_function(result))
+                return result
+        return wrapper
+
+
+def instrument(name: str, kind: str = "stage", counts=None) -> Instrument:
+    """
+    Decorator or context manager measuring a training stage or a serving call
+        @instrument("model_trainer.train")
+        with instrument("serving.load_artifacts", kind="serving"):
+    """
+    return Instrument(name, kind, counts)
+
+
+def _labels(**values) -> str:
+    escaped = {name: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for name, value in values.items()}
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+
+class MetricsRegistry:
+    """
+    Thread safe aggregates of the instrument records of this process:
+    call / error counters, wall time histograms, CPU time sums, the peak RSS
+    seen by each stage and the latest numeric counts, rendered as Prometheus text
+    """
+    def __init__(self, buckets: tuple = WALL_TIME_BUCKETS):
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, kind: str, error: bool, wall_time: float, cpu_time: float,
+                counts: dict, peak_rss_bytes: int = None):
+        key = (name, kind)
+        bucket = bisect.bisect_left(self.buckets, wall_time)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"calls": 0, "errors": 0, "wall_time_sum": 0.0, "cpu_time_sum": 0.0,
+                          "buckets": [0] * len(self.buckets), "peak_rss_bytes": None, "counts": {}}
+                self._series[key] = series
+            series["calls"] += 1
+            series["errors"] += error
+            series["wall_time_sum"] += wall_time
+            series["cpu_time_sum"] += cpu_time
+            series["buckets"][bucket] += 1
+            if peak_rss_bytes is not None:
+                series["peak_rss_bytes"] = max(series["peak_rss_bytes"] or 0, peak_rss_bytes)
+            for count, value in counts.items():
+                if isinstance(value, tuple):
+                    series["counts"].update((f"{count}_{i}", item) for i, item in enumerate(value))
+                else:
+                    series["counts"][count] = value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: {**series, "buckets": list(series["buckets"]), "counts": dict(series["counts"])}
+                    for key, series in self._series.items()}
+
+    def render_prometheus(self, prefix: str = "book_recommender", gauges: dict = None) -> str:
+        """
+        Prometheus text exposition format (version 0.0.4) of every series
+        gauges: extra {name: value} gauges of the caller, e.g. result cache metrics
+        """
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_calls_total Finished instrumented calls",
+            f"# TYPE {prefix}_calls_total counter",
+            *[f"{prefix}_calls_total{_labels(name=name, kind=kind)} {s['calls']}" for (name, kind), s in snapshot.items()],
+            f"# HELP {prefix}_errors_total Instrumented calls that raised",
+            f"# TYPE {prefix}_errors_total counter",
+            *[f"{prefix}_errors_total{_labels(name=name, kind=kind)} {s['errors']}" for (name, kind), s in snapshot.items()],
+            f"# HELP {prefix}_cpu_seconds_total CPU time of instrumented calls",
+            f"# TYPE {prefix}_cpu_seconds_total counter",
+            *[f"{prefix}_cpu_seconds_total{_labels(name=name, kind=kind)} {s['cpu_time_sum']:.9g}" for (name, kind), s in snapshot.items()],
+            f"# HELP {prefix}_wall_seconds Wall time of instrumented calls",
+            f"# TYPE {prefix}_wall_seconds histogram"
+        ]
+        for (name, kind), series in snapshot.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["buckets"]):
+                cumulative += count
+                le = "+Inf" if math.isinf(bound) else f"{bound:g}"
+                lines.append(f"{prefix}_wall_seconds_bucket{_labels(name=name, kind=kind, le=le)} {cumulative}")
+            lines.append(f"{prefix}_wall_seconds_sum{_labels(name=name, kind=kind)} {series['wall_time_sum']:.9g}")
+            lines.append(f"{prefix}_wall_seconds_count{_labels(name=name, kind=kind)} {series['calls']}")
+
+        lines += [f"# HELP {prefix}_stage_peak_rss_bytes Process peak RSS at the end of the stage",
+                  f"# TYPE {prefix}_stage_peak_rss_bytes gauge"]
+        lines += [f"{prefix}_stage_peak_rss_bytes{_labels(name=name)} {s['peak_rss_bytes']}"
+                  for (name, _), s in snapshot.items() if s["peak_rss_bytes"] is not None]
+        lines += [f"# HELP {prefix}_last_count Row / shape counts of the latest call",
+                  f"# TYPE {prefix}_last_count gauge"]
+        lines += [f"{prefix}_last_count{_labels(name=name, count=count)} {_plain(value)}"
+                  for (name, _), s in snapshot.items() for count, value in s["counts"].items()
+                  if isinstance(_plain(value), (int, float)) and not isinstance(value, bool)]
+
+        process_gauges = {"process_resident_memory_bytes": get_rss_bytes(), "process_peak_resident_memory_bytes": get_peak_rss_bytes()}
+        for name, value in {**process_gauges, **(gauges or {})}.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines += [f"# TYPE {prefix}_{name} gauge", f"{prefix}_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+# process wide registry, read by the /metrics endpoint of the HTTP API
+METRICS = MetricsRegistry()
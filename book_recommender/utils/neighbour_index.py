@@ -0,0 +1,254 @@
+import sys
+import time
+import numpy as np
+from scipy.sparse import csr_matrix
+from book_recommender.logging.log import logger
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.utils.neighbours import l2_normalize_rows, top_k_from_similarities, cosine_kneighbors, top_k_cosine_neighbours
+
+class IVFIndex:
+    """
+    Approximate cosine nearest neighbour index (inverted file):
+    rows are L2-normalized and clustered with spherical k-means into n_lists lists,
+    a query only scores the rows of its n_probe closest lists. The row norms are
+    kept next to the lists, so candidates are scored on the raw matrix and scaled.
+    n_probe is the recall/latency knob, n_probe = n_lists is an exact search.
+    Follows the NearestNeighbors fit/kneighbors interface.
+    """
+    backend = "ivf"
+
+    def __init__(self, n_lists: int = 64, n_probe: int = 8, n_iter: int = 10, random_state: int = 42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.random_state = random_state
+        self.matrix = None
+        self.centroids = None
+        self.list_indptr = None
+        self.list_rows = None
+        self.row_norms = None
+
+    def get_params(self) -> dict:
+        return {"n_lists": self.n_lists, "n_probe": self.n_probe,
+                "n_iter": self.n_iter, "random_state": self.random_state}
+
+    def fit(self, matrix):
+        """
+        matrix: csr matrix (titles x users)
+        """
+        normalized = l2_normalize_rows(matrix)
+        n_rows = normalized.shape[0]
+        n_lists = max(1, min(self.n_lists, n_rows))
+        rng = np.random.default_rng(self.random_state)
+        centroids = normalized[rng.choice(n_rows, size=n_lists, replace=False)].toarray()
+
+        for _ in range(self.n_iter):
+            assignment = np.asarray(normalized @ centroids.T).argmax(axis=1)
+            membership = csr_matrix((np.ones(n_rows), (assignment, np.arange(n_rows))), shape=(n_lists, n_rows))
+            sums = np.asarray((membership @ normalized).todense())
+            norms = np.linalg.norm(sums, axis=1)
+            # empty lists keep their previous centroid
+            filled = norms > 0
+            centroids[filled] = sums[filled] / norms[filled, None]
+
+        self.centroids = centroids.astype(np.float32)
+        assignment = np.asarray(normalized @ self.centroids.T).argmax(axis=1)
+        self.list_rows = np.argsort(assignment, kind="stable").astype(np.int32)
+        self.list_indptr = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))]).astype(np.int64)
+        self.matrix = csr_matrix(matrix)
+        self.row_norms = self.compute_row_norms(self.matrix)
+        return self
+
+    @staticmethod
+    def compute_row_norms(matrix) -> np.ndarray:
+        """
+        L2 norm of every row, 1.0 for all zero rows like l2_normalize_rows
+        """
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float64).ravel())
+        norms[norms == 0] = 1.0
+        return norms
+
+    def kneighbors(self, query, n_neighbors: int = 5):
+        """
+        returns (distances, indices) shaped (n_queries, n_neighbors) like NearestNeighbors.kneighbors
+        """
+        query = l2_normalize_rows(query)
+        n_lists = self.centroids.shape[0]
+        n_probe = max(1, min(self.n_probe, n_lists))
+        centroid_sims = np.asarray(query @ self.centroids.T)
+        probed = np.argpartition(-centroid_sims, n_probe - 1, axis=1)[:, :n_probe]
+
+        distances = np.empty((query.shape[0], n_neighbors), dtype=np.float32)
+        indices = np.empty((query.shape[0], n_neighbors), dtype=np.int32)
+        for i, lists in enumerate(probed):
+            candidates = np.concatenate([self.list_rows[self.list_indptr[l]:self.list_indptr[l + 1]] for l in lists])
+            if len(candidates) < n_neighbors:
+                # not enough rows in the probed lists, search everything
+                candidates = np.arange(self.matrix.shape[0])
+            # a dense query vector makes this a sparse matrix-vector product
+            similarities = (self.matrix[candidates] @ query[i].toarray().ravel()).reshape(1, -1) / self.row_norms[candidates]
+            top, top_distances = top_k_from_similarities(similarities, n_neighbors)
+            indices[i] = candidates[top[0]]
+            distances[i] = top_distances[0]
+        return distances, indices
+
+    def to_arrays(self) -> dict:
+        return {"ivf_centroids": self.centroids, "ivf_list_indptr": self.list_indptr, "ivf_list_rows": self.list_rows,
+                "ivf_row_norms": self.row_norms}
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, matrix, params: dict):
+        index = cls(**params)
+        index.centroids = arrays["ivf_centroids"]
+        index.list_indptr = arrays["ivf_list_indptr"]
+        index.list_rows = arrays["ivf_list_rows"]
+        index.matrix = matrix
+        # bundles written before the norms were stored compute them once on load
+        index.row_norms = arrays["ivf_row_norms"] if "ivf_row_norms" in arrays else cls.compute_row_norms(matrix)
+        return index
+
+
+class ItemSimilarityIndex:
+    """
+    Exact item-item cosine model that keeps no copy of the training matrix:
+    rows are L2-normalized once and a blocked sparse product keeps the top_k most
+    similar titles of every row. The result is a pruned k-nearest-neighbour graph
+    in csr form (like sklearn's kneighbors_graph with mode="distance"): row i holds
+    the top_k titles closest to title i, nearest first, data are cosine distances.
+    A query for a title reads its row slice.
+    """
+    backend = "item_similarity"
+
+    def __init__(self, top_k: int = 20, block_size: int = 512, n_jobs: int = 1):
+        self.top_k = top_k
+        self.block_size = block_size
+        self.n_jobs = n_jobs
+        self.graph = None
+
+    def get_params(self) -> dict:
+        return {"top_k": self.top_k, "block_size": self.block_size, "n_jobs": self.n_jobs}
+
+    def fit(self, matrix):
+        """
+        matrix: csr matrix (titles x users)
+        """
+        indices, distances = top_k_cosine_neighbours(matrix, self.top_k, self.block_size, n_jobs=self.n_jobs)
+        return self.set_neighbour_table(indices, distances)
+
+    def set_neighbour_table(self, indices: np.ndarray, distances: np.ndarray):
+        """
+        Uses an already computed (n_rows, k) neighbour table as the graph,
+        the csr arrays are views of the table (no copy of memory mapped arrays)
+        """
+        n_rows, k = indices.shape
+        index_dtype = np.int32 if n_rows * k < np.iinfo(np.int32).max else np.int64
+        self.graph = csr_matrix((distances.reshape(-1), indices.reshape(-1).astype(index_dtype, copy=False),
+                                 np.arange(0, n_rows * k + 1, k, dtype=index_dtype)), shape=(n_rows, n_rows), copy=False)
+        return self
+
+    @property
+    def n_neighbors(self) -> int:
+        """
+        entries per row of the graph
+        """
+        return int(self.graph.indptr[1] - self.graph.indptr[0]) if self.graph.shape[0] else 0
+
+    def neighbour_table(self):
+        """
+        returns (indices int32 [n_rows, k], distances float32 [n_rows, k])
+        """
+        n_rows, k = self.graph.shape[0], self.n_neighbors
+        return self.graph.indices.reshape(n_rows, k).astype(np.int32, copy=False), self.graph.data.reshape(n_rows, k)
+
+    def row_neighbours(self, rows, n_neighbors: int):
+        """
+        The n_neighbors nearest titles of each row id, read from the row slices of the graph
+        returns (distances, indices) shaped (len(rows), n_neighbors) like NearestNeighbors.kneighbors
+        """
+        if n_neighbors > self.n_neighbors:
+            raise ValueError(f"The item similarity graph keeps {self.n_neighbors} neighbours per title, {n_neighbors} requested")
+        positions = self.graph.indptr[np.asarray(rows, dtype=np.int64)][:, None] + np.arange(n_neighbors)
+        return self.graph.data[positions], self.graph.indices[positions].astype(np.int32, copy=False)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.graph.data.nbytes + self.graph.indices.nbytes + self.graph.indptr.nbytes)
+
+    def to_arrays(self) -> dict:
+        # the graph is the neighbour table of the serving bundle, nothing extra to store
+        return {}
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, matrix, params: dict):
+        return cls(**params).set_neighbour_table(arrays["neighbour_indices"], arrays["neighbour_distances"])
+
+
+def build_neighbour_index(backend: str, params: dict = None):
+    """
+    Returns an unfitted neighbour index for the configured backend
+    brute: exact sklearn NearestNeighbors (cosine), ivf: approximate IVFIndex,
+    item_similarity: exact ItemSimilarityIndex
+    """
+    try:
+        params = params or {}
+        if backend == "brute":
+            # imported here, serving never builds an index and starts without sklearn
+            from sklearn.neighbors import NearestNeighbors
+            return NearestNeighbors(algorithm="brute", metric="cosine")
+        if backend == IVFIndex.backend:
+            return IVFIndex(**params)
+        if backend == ItemSimilarityIndex.backend:
+            return ItemSimilarityIndex(**params)
+        raise ValueError(f"Unknown neighbour index backend: {backend}")
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
+
+
+def load_index_from_bundle(arrays: dict, manifest: dict, matrix):
+    """
+    Rebuilds the index stored in a serving bundle,
+    returns None for the brute backend (exact search runs on the matrix directly)
+    """
+    metadata = manifest["metadata"]
+    for index_class in (IVFIndex, ItemSimilarityIndex):
+        if metadata.get("index_backend") == index_class.backend:
+            return index_class.from_arrays(arrays, matrix, metadata.get("index_params", {}))
+    return None
+
+
+def recall_at_k(index, matrix, k: int = 5, sample_size: int = 500, random_state: int = 42) -> dict:
+    """
+    Compares an index against exact brute force cosine search on a sample of rows
+    returns recall@k and mean query latency of both searches
+    """
+    try:
+        rng = np.random.default_rng(random_state)
+        n_rows = matrix.shape[0]
+        rows = rng.choice(n_rows, size=min(sample_size, n_rows), replace=False)
+        query = csr_matrix(matrix)[rows]
+        k = min(k, n_rows)
+
+        start = time.perf_counter()
+        _, exact = cosine_kneighbors(matrix, query, n_neighbors=k)
+        exact_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, approx = index.kneighbors(query, n_neighbors=k)
+        approx_time = time.perf_counter() - start
+
+        hits = sum(len(set(e).intersection(a)) for e, a in zip(exact, approx))
+        report = {
+            "k": k,
+            "sample_size": len(rows),
+            "recall_at_k": hits / (k * len(rows)),
+            "exact_query_ms": 1000 * exact_time / len(rows),
+            "index_query_ms": 1000 * approx_time / len(rows)
+        }
+        logger.info(f"Neighbour index recall report: {report}")
+        return report
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
@@ -0,0 +1,289 @@
+import os
+import sys
+import tempfile
+import numpy as np
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse import csr_matrix, csc_matrix, coo_matrix
+from book_recommender.logging.log import logger
+from book_recommender.exception.exception_handler import AppException
+
+def l2_normalize_rows(matrix) -> csr_matrix:
+    """
+    Returns a float64 copy of the csr matrix with every row scaled to unit length
+    all zero rows are left as zeros
+    """
+    try:
+        matrix = csr_matrix(matrix, dtype=np.float64, copy=True)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        matrix.data /= np.repeat(norms, np.diff(matrix.indptr))
+        return matrix
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
+
+
+def top_k_from_similarities(similarities: np.ndarray, k: int):
+    """
+    Picks the k most similar columns of every row of a dense similarity block
+    returns (indices int32, cosine distances float32) sorted by distance
+    """
+    k = min(k, similarities.shape[1])
+    candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    candidate_sims = np.take_along_axis(similarities, candidates, axis=1)
+    order = np.argsort(-candidate_sims, axis=1, kind="stable")
+    indices = np.take_along_axis(candidates, order, axis=1)
+    distances = np.clip(1.0 - np.take_along_axis(candidate_sims, order, axis=1), 0.0, 2.0)
+    return indices.astype(np.int32), distances.astype(np.float32)
+
+
+def top_k_for_rows(normalized, normalized_t, rows, k: int, block_size: int):
+    """
+    Blocked top-k search of the given rows of a row normalized csr matrix
+    normalized_t: the transposed matrix in csc form
+    """
+    indices = np.empty((len(rows), k), dtype=np.int32)
+    distances = np.empty((len(rows), k), dtype=np.float32)
+    for start in range(0, len(rows), block_size):
+        stop = min(start + block_size, len(rows))
+        similarities = (normalized[rows[start:stop]] @ normalized_t).toarray()
+        indices[start:stop], distances[start:stop] = top_k_from_similarities(similarities, k)
+    return indices, distances
+
+
+# matrices of a shard worker process, memory mapped from the parent's shared directory
+_shard_matrices = {}
+
+def _init_shard_worker(shared_dir: str, shape):
+    arrays = {name[:-4]: np.load(os.path.join(shared_dir, name), mmap_mode="r") for name in os.listdir(shared_dir)}
+    _shard_matrices["normalized"] = csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=shape)
+    _shard_matrices["normalized_t"] = csc_matrix((arrays["t_data"], arrays["t_indices"], arrays["t_indptr"]),
+                                                 shape=(shape[1], shape[0]))
+
+def _top_k_shard(rows, k: int, block_size: int):
+    return top_k_for_rows(_shard_matrices["normalized"], _shard_matrices["normalized_t"], rows, k, block_size)
+
+
+def parallel_top_k_for_rows(normalized, normalized_t, rows, k: int, block_size: int, n_jobs: int):
+    """
+    top_k_for_rows split into row shards over a process pool, the workers
+    memory map the matrices from a temporary directory instead of each
+    receiving a pickled copy; shard results are concatenated in row order
+    """
+    with tempfile.TemporaryDirectory(prefix="neighbours_") as shared_dir:
+        for name, array in {"data": normalized.data, "indices": normalized.indices, "indptr": normalized.indptr,
+                            "t_data": normalized_t.data, "t_indices": normalized_t.indices,
+                            "t_indptr": normalized_t.indptr}.items():
+            np.save(os.path.join(shared_dir, f"{name}.npy"), array)
+
+        # a few shards per worker to even out rows with many ratings
+        n_shards = min(n_jobs * 4, -(-len(rows) // block_size))
+        shards = np.array_split(rows, n_shards)
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_shard_worker,
+                                 initargs=(shared_dir, normalized.shape)) as pool:
+            results = list(pool.map(_top_k_shard, shards, repeat(k), repeat(block_size)))
+
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+def resolve_n_jobs(n_jobs: int) -> int:
+    """
+    -1 (or any value below 1) means every cpu core
+    """
+    if n_jobs is None or n_jobs < 1:
+        return os.cpu_count() or 1
+    return n_jobs
+
+
+def top_k_cosine_neighbours(matrix, k: int, block_size: int = 512, rows=None, n_jobs: int = 1):
+    """
+    Computes the k nearest cosine neighbours of every row of a sparse matrix
+    with blocked sparse matrix products, every row is its own first neighbour
+    matrix: csr matrix (titles x users)
+    k: neighbours kept per row
+    block_size: rows multiplied at once, bounds the dense block to block_size x n_rows
+    rows: optional subset of row ids to compute the neighbours of
+    n_jobs: worker processes, -1 for every cpu core
+    returns (indices int32 [n_query_rows, k], distances float32 [n_query_rows, k])
+    """
+    try:
+        normalized = l2_normalize_rows(matrix)
+        normalized_t = normalized.T.tocsc()
+        rows = np.arange(normalized.shape[0]) if rows is None else np.asarray(rows, dtype=np.int64)
+        k = min(k, normalized.shape[0])
+
+        # a pool only pays off with at least two blocks of work per process
+        n_jobs = min(resolve_n_jobs(n_jobs), len(rows) // (2 * block_size))
+        if n_jobs > 1:
+            indices, distances = parallel_top_k_for_rows(normalized, normalized_t, rows, k, block_size, n_jobs)
+        else:
+            n_jobs = 1
+            indices, distances = top_k_for_rows(normalized, normalized_t, rows, k, block_size)
+
+        logger.info(f"Computed top {k} cosine neighbours for {len(rows)} rows with {n_jobs} process(es)")
+        return indices, distances
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
+
+
+def patch_neighbour_table(matrix, indices, distances, affected, block_size: int = 512, n_jobs: int = 1):
+    """
+    Updates a neighbour table after some rows of the matrix changed, with the
+    same result as recomputing it from scratch:
+    - changed rows, and rows whose old list contains a changed row, are recomputed
+    - every other row merges its old list with its similarities to the changed rows
+    matrix: new csr matrix
+    indices, distances: previous table, already mapped to the new row ids,
+                        rows without a previous list hold -1 indices
+    affected: boolean mask of rows whose vector changed (or that are new)
+    n_jobs: worker processes for the recomputed rows
+    returns (indices, distances, number of fully recomputed rows)
+    """
+    try:
+        k = indices.shape[1]
+        affected_rows = np.flatnonzero(affected)
+        stale = affected | np.isin(indices, affected_rows).any(axis=1) | (indices < 0).any(axis=1)
+        stale_rows = np.flatnonzero(stale)
+        kept_rows = np.flatnonzero(~stale)
+
+        new_indices = indices.copy()
+        new_distances = distances.copy()
+        if len(stale_rows):
+            new_indices[stale_rows], new_distances[stale_rows] = top_k_cosine_neighbours(matrix, k, block_size, rows=stale_rows, n_jobs=n_jobs)
+
+        if len(kept_rows) and len(affected_rows):
+            normalized = l2_normalize_rows(matrix)
+            affected_t = normalized[affected_rows].T.tocsc()
+            for start in range(0, len(kept_rows), block_size):
+                block = kept_rows[start:start + block_size]
+                # the old list is still exact among unchanged rows, only changed rows can enter it
+                candidates = np.hstack([indices[block], np.broadcast_to(affected_rows, (len(block), len(affected_rows)))])
+                similarities = np.hstack([1.0 - distances[block].astype(np.float64), (normalized[block] @ affected_t).toarray()])
+                top, new_distances[block] = top_k_from_similarities(similarities, k)
+                new_indices[block] = np.take_along_axis(candidates, top, axis=1)
+
+        logger.info(f"Patched neighbour table: {len(affected_rows)} changed rows, {len(stale_rows)} rows recomputed")
+        return new_indices, new_distances, len(stale_rows)
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
+
+
+def cosine_kneighbors(matrix, query, n_neighbors: int):
+    """
+    Exact brute force cosine search of the query rows against every row of matrix
+    returns (distances, indices) like NearestNeighbors(metric="cosine").kneighbors
+    """
+    try:
+        similarities = (l2_normalize_rows(query) @ l2_normalize_rows(matrix).T).toarray()
+        indices, distances = top_k_from_similarities(similarities, n_neighbors)
+        return distances, indices
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
+
+
+def gather_neighbours(neighbours, rows, k: int):
+    """
+    Reads the first k precomputed neighbours of many rows from a neighbour table at once
+    neighbours: {"indices": [n_rows, K], "distances": [n_rows, K]} or None
+    rows: array of row ids
+    returns (distances [len(rows), k], indices [len(rows), k], covered mask),
+    rows that are not covered by the table have undefined values in the outputs
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    distances = np.zeros((len(rows), k), dtype=np.float32)
+    indices = np.full((len(rows), k), -1, dtype=np.int32)
+    covered = np.zeros(len(rows), dtype=bool)
+    if neighbours is None or k > neighbours["indices"].shape[1]:
+        return distances, indices, covered
+
+    in_table = rows < neighbours["indices"].shape[0]
+    table_rows = rows[in_table]
+    indices[in_table] = neighbours["indices"][table_rows, :k]
+    distances[in_table] = neighbours["distances"][table_rows, :k]
+    covered[in_table] = (indices[in_table] >= 0).all(axis=1)
+    return distances, indices, covered
+
+
+def aggregate_neighbour_scores(indices, distances, weights, n_rows: int, exclude_rows=None):
+    """
+    Scores the titles in the neighbour lists of a session of titles:
+    score(j) = sum over session titles i of weights[i] * (1 - distance(i, j)),
+    summed in one sparse aggregation (a 1 x n_rows coo vector whose duplicates
+    are added up by tocsr), so the cost grows with len(indices) * k and not with n_rows
+    indices, distances: neighbour lists of the session titles [n_session, k], -1 marks no neighbour
+    weights: [n_session] weight of every session title (e.g. its rating)
+    exclude_rows: rows never returned, e.g. the session titles themselves
+    returns (candidate rows, scores)
+    """
+    valid = np.asarray(indices) >= 0
+    contributions = (np.asarray(weights, dtype=np.float64)[:, None] * (1.0 - np.asarray(distances, dtype=np.float64)))[valid]
+    columns = np.asarray(indices)[valid]
+    scores = coo_matrix((contributions, (np.zeros(len(columns), dtype=np.int32), columns)), shape=(1, n_rows)).tocsr()
+    scores.sum_duplicates()
+    candidates, candidate_scores = scores.indices, scores.data
+    if exclude_rows is not None:
+        keep = ~np.isin(candidates, exclude_rows)
+        candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+    return candidates, candidate_scores
+
+
+def top_n_scores(candidates, scores, n: int):
+    """
+    The n highest scores, best first (ties broken by row id)
+    returns (rows, scores)
+    """
+    if len(candidates) > n:
+        top = np.argpartition(-scores, n - 1)[:n]
+        candidates, scores = candidates[top], scores[top]
+    order = np.lexsort((candidates, -scores))
+    return candidates[order], scores[order]
+
+
+def neighbour_similarity_matrix(indices, distances, n_rows: int) -> csr_matrix:
+    """
+    The neighbour table as a sparse item similarity matrix: row i holds 1 - distance
+    for the neighbours of title i, -1 entries of the table are left out
+    """
+    valid = indices >= 0
+    rows = np.repeat(np.arange(indices.shape[0]), valid.sum(axis=1))
+    return csr_matrix((1.0 - distances[valid].astype(np.float64), (rows, indices[valid])), shape=(n_rows, n_rows))
+
+
+def user_top_n(user_ratings, indices, distances, n: int, block_size: int = 4096):
+    """
+    Precomputes the n best titles of every user: the user's ratings (a row of
+    user_ratings, users x titles) times the item similarity matrix of the neighbour
+    table, one sparse matrix product per block of users, rated titles left out.
+    Same scores as aggregate_neighbour_scores over the user's rated titles.
+    returns (rows int32 [n_users, n], scores float32 [n_users, n]), -1 / 0 pads users with fewer candidates
+    """
+    try:
+        user_ratings = csr_matrix(user_ratings)
+        n_users, n_titles = user_ratings.shape
+        similarity = neighbour_similarity_matrix(indices, distances, n_titles)
+        top_rows = np.full((n_users, n), -1, dtype=np.int32)
+        top_scores = np.zeros((n_users, n), dtype=np.float32)
+        for start in range(0, n_users, block_size):
+            block = user_ratings[start:start + block_size]
+            scores = (block.astype(np.float64) @ similarity).tocsr()
+            scores.sort_indices()
+            for i in range(block.shape[0]):
+                candidates = scores.indices[scores.indptr[i]:scores.indptr[i + 1]]
+                candidate_scores = scores.data[scores.indptr[i]:scores.indptr[i + 1]]
+                keep = ~np.isin(candidates, block.indices[block.indptr[i]:block.indptr[i + 1]])
+                # ranked on the stored float32 scores, like the live scoring in serving
+                rows, row_scores = top_n_scores(candidates[keep], candidate_scores[keep].astype(np.float32), n)
+                top_rows[start + i, :len(rows)] = rows
+                top_scores[start + i, :len(rows)] = row_scores
+        return top_rows, top_scores
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
@@ -0,0 +1,101 @@
+import io
+import os
+import time
+import hashlib
+import threading
+import urllib.error
+import urllib.request
+
+# responses larger than this are not cover images
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+# Amazon answers unknown covers with a 1x1 gif instead of a 404
+MIN_IMAGE_SIDE = 10
+# statuses worth another try, anything else (403 / 404 / 410 ...) means the poster is gone
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+USER_AGENT = "book-recommender-poster-cache/1.0"
+
+
+class RateLimiter:
+    """
+    Spaces request starts at least 1 / rate seconds apart across all threads
+    rate: requests per second, 0 or None disables the limit
+    """
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def fetch_image(url: str, timeout: float, max_retries: int, backoff_seconds: float, rate_limiter: RateLimiter = None):
+    """
+    Downloads one poster, retrying timeouts, connection errors, 429 and 5xx with exponential backoff
+    returns (status, data): ("ok", bytes), ("missing", None) or ("failed", None)
+    """
+    for attempt in range(max_retries + 1):
+        if attempt:
+            time.sleep(backoff_seconds * 2 ** (attempt - 1))
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        try:
+            request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                data = response.read(MAX_IMAGE_BYTES + 1)
+            if len(data) > MAX_IMAGE_BYTES:
+                return "missing", None
+            return "ok", data
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_STATUSES:
+                return "missing", None
+        except ValueError:
+            # malformed url
+            return "missing", None
+        except (urllib.error.URLError, OSError):
+            pass
+    return "failed", None
+
+
+def make_thumbnail(data: bytes, size: tuple):
+    """
+    Resizes an image to fit into size (width, height), keeping its aspect ratio
+    returns JPEG bytes, None for placeholders and undecodable images
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if min(image.size) < MIN_IMAGE_SIDE:
+                return None
+            image = image.convert("RGB")
+            image.thumbnail(size)
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=85, optimize=True)
+            return output.getvalue()
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+
+def store_thumbnail(thumbnails_dir: str, data: bytes) -> str:
+    """
+    Writes a thumbnail under the sha256 of its bytes, identical covers are stored once
+    returns the path relative to thumbnails_dir, e.g. "3f/3fa1...e9.jpg"
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    relative_path = os.path.join(digest[:2], f"{digest}.jpg")
+    path = os.path.join(thumbnails_dir, relative_path)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return relative_path
@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import hashlib
+from book_recommender.logging.log import logger
+from book_recommender.exception.exception_handler import AppException
+from book_recommender.utils.util import file_sha256
+
+class StageCache:
+    """
+    Content addressed cache for pipeline stages.
+    A stage fingerprint is the sha256 of its input files plus its config.yaml section,
+    it is recorded with the fingerprints of the outputs once the stage succeeded.
+    The stage is skipped while its fingerprint matches and its outputs are unchanged.
+    File hashes are reused while size and mtime of a file did not change.
+    """
+    def __init__(self, stage_cache_dir: str):
+        self.stage_cache_dir = stage_cache_dir
+        self._hashes_path = os.path.join(stage_cache_dir, "file_hashes.json")
+        self._file_hashes = None
+
+    def _load_file_hashes(self) -> dict:
+        if self._file_hashes is None:
+            self._file_hashes = {}
+            if os.path.exists(self._hashes_path):
+                with open(self._hashes_path, "r") as f:
+                    self._file_hashes = json.load(f)
+        return self._file_hashes
+
+    def _write_json(self, path: str, content: dict):
+        os.makedirs(self.stage_cache_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(content, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def file_hash(self, path: str) -> str:
+        """
+        sha256 of a file, cached by (size, mtime)
+        """
+        stat = os.stat(path)
+        file_hashes = self._load_file_hashes()
+        key = os.path.abspath(path)
+        cached = file_hashes.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        file_hashes[key] = [stat.st_size, stat.st_mtime_ns, file_sha256(path)]
+        return file_hashes[key][2]
+
+    def path_hash(self, path: str):
+        """
+        sha256 of a file or of every file below a directory, None if the path is missing
+        """
+        if os.path.isfile(path):
+            return self.file_hash(path)
+        if not os.path.isdir(path):
+            return None
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if name.startswith("."):
+                    continue
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(self.file_hash(file_path).encode())
+        return digest.hexdigest()
+
+    def fingerprint(self, inputs: list, config: dict) -> str:
+        """
+        inputs: files or directories the stage reads
+        config: config.yaml sections the stage depends on
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+        for path in inputs:
+            digest.update(path.encode())
+            digest.update(str(self.path_hash(path)).encode())
+        return digest.hexdigest()
+
+    def _record_path(self, stage: str) -> str:
+        return os.path.join(self.stage_cache_dir, f"{stage}.json")
+
+    def is_fresh(self, stage: str, fingerprint: str, outputs: list) -> bool:
+        record_path = self._record_path(stage)
+        if not os.path.exists(record_path):
+            return False
+        with open(record_path, "r") as f:
+            record = json.load(f)
+        if record.get("fingerprint") != fingerprint:
+            return False
+        return all(self.path_hash(path) is not None and self.path_hash(path) == record["outputs"].get(path)
+                   for path in outputs)
+
+    def record(self, stage: str, fingerprint: str, outputs: list):
+        self._write_json(self._record_path(stage), {
+            "fingerprint": fingerprint,
+            "outputs": {path: self.path_hash(path) for path in outputs}
+        })
+        self._write_json(self._hashes_path, self._load_file_hashes())
+
+    def run_stage(self, stage: str, run, inputs: list, config: dict, outputs: list, force: bool = False) -> bool:
+        """
+        Runs the stage unless its fingerprint and outputs match the last successful run
+        returns True when the stage ran, False when it was skipped
+        """
+        try:
+            fingerprint = self.fingerprint(inputs, config)
+            if not force and self.is_fresh(stage, fingerprint, outputs):
+                logger.info(f"Skipping stage {stage}: inputs unchanged (fingerprint {fingerprint[:12]})")
+                return False
+
+            run()
+            # inputs may only exist once earlier stages ran, fingerprint them after the run
+            self.record(stage, self.fingerprint(inputs, config), outputs)
+            return True
+
+        except Exception as e:
+            logger.error(e)
+            raise AppException(e, sys) from e
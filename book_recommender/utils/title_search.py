@@ -0,0 +1,152 @@
+import re
+import sys
+import unicodedata
+import numpy as np
+from book_recommender.logging.log import logger
+from book_recommender.exception.exception_handler import AppException
+
+SEARCH_ARRAY_PREFIX = "search_"
+_WORD = re.compile(r"[^\W_]+")
+
+def normalize_title(title) -> str:
+    """
+    Case folded, accent free title with words separated by single spaces
+    """
+    text = unicodedata.normalize("NFKD", str(title).casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(_WORD.findall(text))
+
+
+def title_trigrams(normalized: str) -> list:
+    padded = f" {normalized} "
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+def _postings(pairs: list, dtype):
+    """
+    (key, row) pairs -> (sorted keys, rows) arrays
+    """
+    keys = np.asarray([key for key, _ in pairs], dtype=dtype if pairs else "<U1")
+    rows = np.asarray([row for _, row in pairs], dtype=np.int32)
+    order = np.argsort(keys, kind="stable")
+    return keys[order], rows[order]
+
+
+def build_title_search_arrays(titles, popularity) -> dict:
+    """
+    Arrays of the title search index, saved next to the other artifacts:
+    - sorted (token, row) postings for prefix search on normalized words
+    - trigram postings (unique trigrams + indptr into rows) for typo tolerant search
+    - normalized titles, trigram counts and popularity (ratings per title) for ranking
+    titles: row aligned titles of the pivot
+    popularity: row aligned number of ratings per title
+    """
+    try:
+        normalized = [normalize_title(title) for title in titles]
+        token_pairs, trigram_pairs = [], []
+        trigram_counts = np.zeros(len(normalized), dtype=np.int32)
+        for row, text in enumerate(normalized):
+            token_pairs.extend((token, row) for token in set(text.split()))
+            trigrams = title_trigrams(text) if text else []
+            trigram_pairs.extend((trigram, row) for trigram in trigrams)
+            trigram_counts[row] = len(trigrams)
+
+        tokens, token_rows = _postings(token_pairs, str)
+        trigram_keys, trigram_rows = _postings(trigram_pairs, "<U3")
+        trigrams, trigram_starts = np.unique(trigram_keys, return_index=True)
+        trigram_indptr = np.append(trigram_starts, len(trigram_keys)).astype(np.int64)
+
+        arrays = {
+            "normalized": np.asarray(normalized, dtype=str),
+            "tokens": tokens,
+            "token_rows": token_rows,
+            "trigrams": trigrams,
+            "trigram_indptr": trigram_indptr,
+            "trigram_rows": trigram_rows,
+            "trigram_counts": trigram_counts,
+            "popularity": np.asarray(popularity, dtype=np.int32)
+        }
+        logger.info(f"Built title search index: {len(normalized)} titles, {len(tokens)} token postings, {len(trigrams)} trigrams")
+        return {f"{SEARCH_ARRAY_PREFIX}{name}": array for name, array in arrays.items()}
+
+    except Exception as e:
+        logger.error(e)
+        raise AppException(e, sys) from e
+
+
+class TitleSearchIndex:
+    """
+    Ranked title search over the arrays of build_title_search_arrays (plain or memory mapped).
+    Every query word must prefix match a title word; exact titles, titles starting
+    with the query and popular titles rank first. When there are fewer than limit
+    prefix matches, titles containing enough of the query's trigrams fill the list.
+    Only the postings of the query words / trigrams are read, never the whole catalogue.
+    """
+    def __init__(self, arrays: dict, min_similarity: float = 0.5):
+        self.arrays = {name[len(SEARCH_ARRAY_PREFIX):]: array for name, array in arrays.items()
+                       if name.startswith(SEARCH_ARRAY_PREFIX)}
+        self.min_similarity = min_similarity
+
+    def _prefix_range(self, token: str):
+        # every token starting with `token` sorts between it and its last character + 1
+        upper = token[:-1] + chr(ord(token[-1]) + 1)
+        return np.searchsorted(self.arrays["tokens"], [token, upper])
+
+    def _prefix_rows(self, start: int, stop: int) -> np.ndarray:
+        rows = self.arrays["token_rows"][start:stop]
+        # rows of a single token are already sorted and unique
+        if stop - start > 1 and self.arrays["tokens"][start] != self.arrays["tokens"][stop - 1]:
+            rows = np.unique(rows)
+        return rows
+
+    def _prefix_matches(self, normalized: str) -> np.ndarray:
+        # rarest words first, the candidate set only shrinks from there
+        ranges = sorted((self._prefix_range(token) for token in set(normalized.split())), key=lambda r: r[1] - r[0])
+        candidates = None
+        for start, stop in ranges:
+            rows = self._prefix_rows(start, stop)
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+            if len(candidates) == 0:
+                break
+        texts = self.arrays["normalized"][candidates]
+        order = np.lexsort((np.char.str_len(texts), -self.arrays["popularity"][candidates],
+                            ~np.char.startswith(texts, normalized), texts != normalized))
+        return candidates[order]
+
+    def _fuzzy_matches(self, normalized: str):
+        query_trigrams = np.asarray(title_trigrams(normalized), dtype="<U3")
+        trigrams = self.arrays["trigrams"]
+        positions = np.searchsorted(trigrams, query_trigrams)
+        found = positions < len(trigrams)
+        found[found] = trigrams[positions[found]] == query_trigrams[found]
+        indptr = self.arrays["trigram_indptr"]
+        postings = [self.arrays["trigram_rows"][indptr[p]:indptr[p + 1]] for p in positions[found]]
+        if not postings:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+
+        rows, shared = np.unique(np.concatenate(postings), return_counts=True)
+        # share of the query found in the title, long titles are not penalized for their extra words
+        similarity = shared / len(query_trigrams)
+        keep = similarity >= self.min_similarity
+        rows, similarity, shared = rows[keep], similarity[keep], shared[keep]
+        jaccard = shared / (len(query_trigrams) + self.arrays["trigram_counts"][rows] - shared)
+        order = np.lexsort((-self.arrays["popularity"][rows], -jaccard, -similarity))
+        return rows[order], similarity[order]
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """
+        returns up to limit row ids, best match first
+        """
+        normalized = normalize_title(query)
+        if not normalized or limit <= 0:
+            return []
+        rows = self._prefix_matches(normalized)[:limit].tolist()
+        if len(rows) < limit:
+            fuzzy_rows, _ = self._fuzzy_matches(normalized)
+            seen = set(rows)
+            rows.extend(row for row in fuzzy_rows.tolist() if row not in seen)
+        return rows[:limit]
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(array.nbytes for array in self.arrays.values()))
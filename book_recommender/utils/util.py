@@ -1,5 +1,7 @@
 import yaml
 import sys
+import hashlib
+import numpy as np
 from book_recommender.logging.log import logger
 from book_recommender.exception.exception_handler import AppException
 
@@ -13,4 +15,61 @@ def read_yaml_file(file_path: str) -> dict:
             return yaml.safe_load(yaml_file)
     except Exception as e:
         logger.error(e)
-        raise AppException(e, sys) from e
\ No newline at end of file
+        raise AppException(e, sys) from e
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_object_nbytes(obj) -> int:
+    """
+    Estimates the in-memory footprint of a loaded artifact in bytes
+    obj: DataFrame, Index, numpy array, scipy sparse matrix or fitted estimator
+    """
+    if all(hasattr(obj, attr) for attr in ("data", "indices", "indptr")):
+        return int(obj.data.nbytes + obj.indices.nbytes + obj.indptr.nbytes)
+    if hasattr(obj, "memory_usage"):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    if hasattr(obj, "nbytes"):
+        return int(obj.nbytes)
+    if hasattr(obj, "_fit_X"):
+        return sys.getsizeof(obj) + get_object_nbytes(obj._fit_X)
+    if getattr(obj, "matrix", None) is not None:
+        # indexes keeping the rating matrix, e.g. IVFIndex
+        return sys.getsizeof(obj) + get_object_nbytes(obj.matrix)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(sys.getsizeof(k) + get_object_nbytes(v) for k, v in obj.items())
+    return sys.getsizeof(obj)
+
+
+def get_wide_nbytes(obj) -> int:
+    """
+    Estimates the footprint of an artifact before the dtype policy: numbers as
+    8 byte float64 / int64 and text as python strings instead of categoricals
+    obj: DataFrame, numpy array, scipy sparse matrix or fitted estimator
+    """
+    if all(hasattr(obj, attr) for attr in ("data", "indices", "indptr")):
+        # scipy picks the index dtype itself, only the values were wider
+        return int(8 * obj.data.size + obj.indices.nbytes + obj.indptr.nbytes)
+    if hasattr(obj, "columns"):
+        # a dense pivot has one numeric column per user, only text columns are measured one by one
+        numeric = [dtype.kind in "biuf" for dtype in obj.dtypes]
+        text_nbytes = sum(get_wide_nbytes(obj.iloc[:, i]) for i, is_numeric in enumerate(numeric) if not is_numeric)
+        return int(8 * len(obj) * sum(numeric) + text_nbytes + obj.index.memory_usage(deep=True))
+    if hasattr(obj, "cat"):
+        # one pointer per row plus one string object per row, as read_csv returns text
+        sizes = np.array([sys.getsizeof(value) for value in obj.cat.categories] + [0])
+        return int(8 * len(obj) + sizes[obj.cat.codes.to_numpy()].sum())
+    if hasattr(obj, "dtype") and obj.dtype.kind in "biuf":
+        return int(8 * obj.size)
+    if hasattr(obj, "_fit_X"):
+        return sys.getsizeof(obj) + get_wide_nbytes(obj._fit_X)
+    if getattr(obj, "matrix", None) is not None:
+        return sys.getsizeof(obj) + get_wide_nbytes(obj.matrix)
+    return get_object_nbytes(obj)
@@ -1,4 +1,21 @@
-from book_recommender.pipeline.training_pipeline import TrainingPipeline
+import argparse
+from book_recommender.constant import STAGES
 
-pipeline = TrainingPipeline()
-pipeline.start_training_pipeline()
\ No newline at end of file
+parser = argparse.ArgumentParser(description="Book recommender training pipeline")
+parser.add_argument("--incremental", metavar="RATINGS_CSV",
+                    help="apply a csv of new ratings to the latest artifacts instead of a full run")
+parser.add_argument("--force", action="store_true",
+                    help="re-run every stage even when its inputs did not change")
+parser.add_argument("--from-stage", choices=STAGES,
+                    help="re-run this stage and all stages after it")
+args = parser.parse_args()
+
+# the pipelines pull in pandas, scipy and sklearn, only import the one that runs
+if args.incremental:
+    from book_recommender.pipeline.incremental_pipeline import IncrementalPipeline
+    pipeline = IncrementalPipeline()
+    pipeline.start_incremental_pipeline(args.incremental)
+else:
+    from book_recommender.pipeline.training_pipeline import TrainingPipeline
+    pipeline = TrainingPipeline()
+    pipeline.start_training_pipeline(force=args.force, from_stage=args.from_stage)
@@ -0,0 +1,3 @@
+from book_recommender.serving.registry_cli import main
+
+main()
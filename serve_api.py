@@ -0,0 +1,3 @@
+from book_recommender.serving.http_api import main
+
+main()